@@ -1,7 +1,16 @@
 from synthesis.synthesize import *
+from synthesis.cache import SynthesisCache, MelCache, checkpoint_id
+from synthesis.encoders import AUDIO_FORMATS, AUDIO_EXTENSIONS
+from synthesis.scheduler import SynthesisScheduler, SchedulerRejected
+from synthesis.server import BatchingServer
+from synthesis.session import InferenceSession
+from synthesis.worker_pool import WorkerPool
+from synthesis.voice import PCMStream
 import os
+import asyncio
 import discord
-from time import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from dotenv import load_dotenv
 from string import punctuation as punct
 
@@ -10,19 +19,118 @@ APP_PATH = os.path.dirname(os.path.realpath(__file__))
 MODEL = os.path.join(APP_PATH, "Model", "Werner_Herzog", "Werner_Herzog")
 VOCODER_MODEL = os.path.join(APP_PATH, "Vocoder", "Pretrained", "g_02500000")
 VOCODER_CONFIG = os.path.join(APP_PATH, "Vocoder", "Pretrained", "config.json")
-AUDIO_PATH = os.path.join(APP_PATH, "Audio")
+SAMPLE_RATE = 22050
 
 # Environment variables
 load_dotenv()
 TOKEN = os.getenv('DISCORD_TOKEN')
 PREFIX = os.getenv('COMMAND_PREFIX')
+VOCODER_BACKEND = os.getenv('VOCODER_BACKEND', 'torch')
+VOCODER_PRECISION = os.getenv('VOCODER_PRECISION', 'fp32')
+QUANTIZE = os.getenv('QUANTIZE', 'false').lower() == 'true'
+VOCODER_TILE_FRAMES = int(os.getenv('VOCODER_TILE_FRAMES', '0'))
+CACHE_DIR = os.getenv('CACHE_DIR')
+MEL_CACHE_DIR = os.getenv('MEL_CACHE_DIR')
+AUDIO_FORMAT = os.getenv('AUDIO_FORMAT', 'opus')
+VOICE_COMMAND = os.getenv('VOICE_COMMAND', 'voice')
+SYNTHESIS_WORKERS = int(os.getenv('SYNTHESIS_WORKERS', '2'))
+SYNTHESIS_PROCESSES = os.getenv('SYNTHESIS_PROCESSES', 'false').lower() == 'true'
+MAX_QUEUED = int(os.getenv('MAX_QUEUED', '32'))
+QUEUE_DEADLINE = float(os.getenv('QUEUE_DEADLINE', '60'))
+USER_RATE_LIMIT = int(os.getenv('USER_RATE_LIMIT', '10'))
+GUILD_RATE_LIMIT = int(os.getenv('GUILD_RATE_LIMIT', '30'))
+MAX_BATCH_SIZE = int(os.getenv('MAX_BATCH_SIZE', '1'))
+BATCH_WINDOW_MS = float(os.getenv('BATCH_WINDOW_MS', '5'))
 
 # Globals
-model = None
-vocoder = None
+session = None
+
+# Synthesis runs in these threads so the event loop stays responsive.
+# Torch releases the GIL inside its ops, so concurrent messages are synthesized in parallel
+executor = ThreadPoolExecutor(max_workers=SYNTHESIS_WORKERS)
+
+# Queues messages shortest-first in front of the executor and turns away floods early
+scheduler = SynthesisScheduler(
+    executor,
+    max_in_flight=SYNTHESIS_WORKERS,
+    max_queued=MAX_QUEUED,
+    user_rate=USER_RATE_LIMIT,
+    guild_rate=GUILD_RATE_LIMIT,
+    deadline=QUEUE_DEADLINE
+)
+
+# Split the CPU threads between workers so parallel requests don't oversubscribe the cores
+torch.set_num_threads(max(1, torch.get_num_threads() // SYNTHESIS_WORKERS))
 
 client = discord.Client()
 
+def stream_synthesis(text, source):
+    # Feed the voice channel as audio is produced, giving up if playback stops
+    try:
+        for audio in session.stream(text, split_text=(True if len(text) >= 160 else False)):
+            if(not source.write(audio)):
+                break
+    finally:
+        source.close()
+
+async def speak(message, text):
+    channel = message.channel
+    
+    # The author has to be in a voice channel for the bot to join
+    voice_state = message.author.voice
+    if(voice_state is None or voice_state.channel is None):
+        await channel.send("Error! Join a voice channel first")
+        return
+    
+    voice_client = message.guild.voice_client
+    if(voice_client is None):
+        voice_client = await voice_state.channel.connect()
+    elif(voice_client.channel != voice_state.channel):
+        await voice_client.move_to(voice_state.channel)
+    
+    if(voice_client.is_playing()):
+        await channel.send("Error! Already speaking in this server")
+        return
+    
+    # Synthesis writes into the stream while it plays
+    source = PCMStream(SAMPLE_RATE)
+    try:
+        job = scheduler.submit(
+            partial(stream_synthesis, text, source),
+            cost=len(clean_text(text)),
+            user=message.author.id,
+            guild=message.guild.id,
+            # Playback paces the job, so its run time says nothing about synthesis speed
+            timed=False
+        )
+    except SchedulerRejected as e:
+        await voice_client.disconnect()
+        await channel.send(str(e))
+        return
+    
+    # Set from discord's playback thread once the stream has drained
+    finished = asyncio.Event()
+    try:
+        voice_client.play(source, after=lambda error: client.loop.call_soon_threadsafe(finished.set))
+    except Exception:
+        # Stop the synthesis job, otherwise it blocks on the full stream forever
+        source.cleanup()
+        job.cancel()
+        await voice_client.disconnect()
+        print("Error playing voice")
+        await channel.send("Error! Couldn't play audio in the voice channel")
+        return
+    
+    try:
+        await job
+    except Exception as e:
+        print("Error synthesizing voice")
+        await channel.send(e)
+    
+    # Synthesis finishes before the buffered audio has played, so leave once playback ends
+    await finished.wait()
+    await voice_client.disconnect()
+
 @client.event
 async def on_message(message):
     tokens = message.content.split()
@@ -41,11 +149,16 @@ async def on_message(message):
     # Strip the prefix from the message
     text = message.content.replace(PREFIX + " ", '')
     
+    # Messages starting with the voice command are spoken in the author's voice channel
+    voice = message.guild and text.split() and text.split()[0].lower() == VOICE_COMMAND.lower()
+    if(voice):
+        text = text.strip()[len(VOICE_COMMAND):].strip()
+    
     # Channel the message was sent from
     channel = message.channel
     
     # Check if text for synthesis is empty
-    if(text.isspace() or text.lower() == PREFIX.lower()):
+    if(not text or text.isspace() or text.lower() == PREFIX.lower()):
         await channel.send("Error! Text is empty")
         return
        
@@ -53,30 +166,43 @@ async def on_message(message):
     if(text[-1] not in punct):
         text += '.'
     
+    if(voice):
+        await speak(message, text)
+        return
+    
+    # Queue the synthesizer, ordered by the length of the text it will actually synthesize
+    try:
+        job = scheduler.submit(
+            partial(
+                session.run,
+                text,
+                return_audio=True,
+                audio_format=AUDIO_FORMAT,
+                split_text=(True if len(text) >= 160 else False)
+            ),
+            cost=len(clean_text(text)),
+            user=message.author.id,
+            guild=(message.guild.id if message.guild else None)
+        )
+    except SchedulerRejected as e:
+        await channel.send(str(e))
+        return
+    
     # Send an acknowledgement message to show that the bot is actually doing something
     ack_msg = await channel.send("Generating audio...")
     
-    # Audio file path and name
-    audio_file = AUDIO_PATH + "/%s.wav" % (time() * 1000)
-    
-    # Run the synthesizer
+    # Wait for the synthesizer in the worker pool
     try:
-        synthesize(
-            model=model,
-            text=text,
-            audio_path=audio_file,
-            vocoder=vocoder,
-            split_text=(True if len(text) >= 160 else False)
-        )
+        audio = await job
     except Exception as e:
         print("Error synthesizing voice")
         await ack_msg.delete()
         await channel.send(e)
         return
     
-    # Create the file object for messaging
+    # Create the file object for messaging straight from the in-memory WAV
     try:
-        file = discord.File(audio_file)
+        file = discord.File(audio, filename="%s%s" % (message.id, AUDIO_EXTENSIONS[AUDIO_FORMAT]))
     except:
         print("Error creating file")
         await ack_msg.delete()
@@ -88,28 +214,50 @@ async def on_message(message):
     
     # Send the audio clip to the channel
     await channel.send(file=file, content=text)
-    
-    # Delete the file
-    if(os.path.exists(audio_file)):
-       os.remove(audio_file)
 
-@client.event
-async def on_ready():
+def load():
+    assert AUDIO_FORMAT in AUDIO_FORMATS, "Unknown audio format %s" % AUDIO_FORMAT
+
     # Make sure the models exist
     assert os.path.isfile(MODEL), "Model not found"
     assert os.path.isfile(VOCODER_MODEL), "vocoder model not found"
-    
-    # Create the Audio directory if it doesn't already exist
-    if(not os.path.isdir(AUDIO_PATH)):
-        os.mkdir(AUDIO_PATH)
 
-    global model
-    global vocoder
+    global session
     
     # Load the models
-    model = load_model(MODEL)
-    vocoder = Hifigan(VOCODER_MODEL, VOCODER_CONFIG)
+    model = load_model(MODEL, quantize=QUANTIZE)
+    vocoder = load_vocoder(VOCODER_MODEL, VOCODER_CONFIG, VOCODER_BACKEND, VOCODER_PRECISION, VOCODER_TILE_FRAMES)
+    
+    # Cache finished clips so repeated phrases skip synthesis
+    # Key on the file actually loaded, so regenerating the TorchScript export invalidates the caches
+    model_id = "%s-%s" % (checkpoint_id(resolve_model_path(MODEL)), QUANTIZE)
+    vocoder_id = "%s-%s-%s" % (checkpoint_id(VOCODER_MODEL), VOCODER_BACKEND, VOCODER_PRECISION)
+    cache = SynthesisCache("%s-%s" % (model_id, vocoder_id), cache_dir=CACHE_DIR)
 
-    print(f'{client.user} is ready')
+    # Cache sentence mels so long messages only decode new sentences
+    mel_cache = MelCache(model_id, cache_dir=MEL_CACHE_DIR)
+
+    server = None
+    pool = None
+    if SYNTHESIS_PROCESSES:
+        # Fork the workers before any other threads start. They share the model weights
+        pool = WorkerPool(model, vocoder, num_workers=SYNTHESIS_WORKERS, cache=cache, mel_cache=mel_cache)
+    elif MAX_BATCH_SIZE > 1:
+        # Batch sentences from concurrent messages together
+        server = BatchingServer(
+            model,
+            vocoder,
+            max_batch_size=MAX_BATCH_SIZE,
+            window=BATCH_WINDOW_MS / 1000,
+            mel_cache=mel_cache
+        )
     
+    # Every message is synthesized through the session
+    session = InferenceSession(model, vocoder, cache=cache, mel_cache=mel_cache, server=server, pool=pool)
+
+@client.event
+async def on_ready():
+    print(f'{client.user} is ready')
+
+load()
 client.run(TOKEN)
\ No newline at end of file
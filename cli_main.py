@@ -2,6 +2,8 @@ import os
 import readline
 import sys
 from synthesis.synthesize import *
+from synthesis.cache import SynthesisCache, MelCache, checkpoint_id
+from synthesis.session import InferenceSession
 from string import punctuation as punct
 
 # Paths
@@ -13,6 +15,22 @@ AUDIO_PATH = os.path.join(APP_PATH, "Audio")
 
 EXIT_KEYWORD = "exit"
 
+# Vocoder backend ("torch", "onnx" or "griffin_lim")
+VOCODER_BACKEND = os.getenv("VOCODER_BACKEND", "torch")
+
+# Opt-in CPU speedups (see synthesis/quantize.py)
+VOCODER_PRECISION = os.getenv("VOCODER_PRECISION", "fp32")
+QUANTIZE = os.getenv("QUANTIZE", "false").lower() == "true"
+
+# Vocode long clips in tiles of this many mel frames to bound memory use (0 for off)
+VOCODER_TILE_FRAMES = int(os.getenv("VOCODER_TILE_FRAMES", "0"))
+
+# Directory for the on-disk synthesis cache (memory only if not set)
+CACHE_DIR = os.getenv("CACHE_DIR")
+
+# Directory to spill the per-sentence mel cache to (memory only if not set)
+MEL_CACHE_DIR = os.getenv("MEL_CACHE_DIR")
+
 def main():
     # Make sure the models exist
     assert os.path.isfile(MODEL), "Model not found"
@@ -22,12 +40,20 @@ def main():
     if(not os.path.isdir(AUDIO_PATH)):
         os.mkdir(AUDIO_PATH)
 
-    global model
-    global vocoder
-    
     # Load the models
-    model = load_model(MODEL)
-    vocoder = Hifigan(VOCODER_MODEL, VOCODER_CONFIG)
+    model = load_model(MODEL, quantize=QUANTIZE)
+    vocoder = load_vocoder(VOCODER_MODEL, VOCODER_CONFIG, VOCODER_BACKEND, VOCODER_PRECISION, VOCODER_TILE_FRAMES)
+    
+    # Cache finished clips so repeated phrases skip synthesis
+    # Key on the file actually loaded, so regenerating the TorchScript export invalidates the caches
+    model_id = "%s-%s" % (checkpoint_id(resolve_model_path(MODEL)), QUANTIZE)
+    vocoder_id = "%s-%s-%s" % (checkpoint_id(VOCODER_MODEL), VOCODER_BACKEND, VOCODER_PRECISION)
+    cache = SynthesisCache("%s-%s" % (model_id, vocoder_id), cache_dir=CACHE_DIR)
+
+    # Cache sentence mels so long messages only decode new sentences
+    mel_cache = MelCache(model_id, cache_dir=MEL_CACHE_DIR)
+    
+    session = InferenceSession(model, vocoder, cache=cache, mel_cache=mel_cache)
     
     os.system('cls||clear')
     
@@ -50,11 +76,9 @@ def main():
             
             # Run the synthesizer
             try:
-                synthesize(
-                    model=model,
-                    text=text,
+                session.run(
+                    text,
                     audio_path=audio_file,
-                    vocoder=vocoder,
                     split_text=(True if len(text) >= 160 else False)
                 )
             except Exception as e:
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import torch
+
+
+def checkpoint_id(path):
+    """
+    Hashes a model checkpoint so cache entries are invalidated when the model changes.
+
+    Parameters
+    ----------
+    path : str
+        Path to the checkpoint
+
+    Returns
+    -------
+    str
+        sha256 hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class SynthesisCache:
+    """
+    Content-addressed cache of synthesized audio files.
+    Entries live in an in-memory LRU and, when cache_dir is given, in an on-disk tier
+    that evicts the least recently used files once it grows past max_disk_bytes.
+    Safe to share between threads, and the on-disk tier between processes (e.g. forked workers).
+
+    Parameters
+    ----------
+    model_id : str
+        Identity of the models producing the audio (see checkpoint_id)
+    cache_dir : str (optional)
+        Directory for the on-disk tier (default is memory only)
+    max_memory_items : int (optional)
+        Number of entries kept in memory (default is 128)
+    max_disk_bytes : int (optional)
+        Size cap of the on-disk tier (default is 512MB)
+    """
+
+    def __init__(self, model_id, cache_dir=None, max_memory_items=128, max_disk_bytes=512 * 1024 * 1024):
+        self.model_id = model_id
+        self.cache_dir = cache_dir
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, text, **params):
+        """
+        Builds the cache key for normalized text and synthesis parameters.
+
+        Parameters
+        ----------
+        text : str
+            Normalized text (clean_text output)
+        **params
+            Synthesis parameters that change the output
+
+        Returns
+        -------
+        str
+            sha256 hex digest
+        """
+        payload = json.dumps({"model": self.model_id, "text": text, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _tmp_path(self, key):
+        # Unique per process, so workers writing the same entry don't clash
+        return "%s.%d.tmp" % (self._path(key), os.getpid())
+
+    def get(self, key):
+        """
+        Fetches cached data, promoting disk hits into memory.
+
+        Parameters
+        ----------
+        key : str
+            Cache key
+
+        Returns
+        -------
+        bytes
+            Cached data or None on a miss
+        """
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                return self.memory[key]
+
+            if not self.cache_dir:
+                return None
+
+            try:
+                with open(self._path(key), "rb") as f:
+                    data = f.read()
+                # Touch the file so disk eviction sees it as recently used
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                return None
+            self._put_memory(key, data)
+            return data
+
+    def put(self, key, data):
+        """
+        Stores data in both tiers.
+
+        Parameters
+        ----------
+        key : str
+            Cache key
+        data : bytes
+            Data to cache
+        """
+        with self.lock:
+            self._put_memory(key, data)
+
+            if not self.cache_dir:
+                return
+
+            tmp_path = self._tmp_path(key)
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            self._evict_disk()
+
+    def _put_memory(self, key, data):
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self):
+        # Measure the directory itself, since other processes may be writing to it too
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            # Files still being written
+            if name.endswith(".tmp"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        disk_bytes = sum(size for _, size, _ in entries)
+        # Oldest first
+        for _, size, path in sorted(entries):
+            if disk_bytes <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another process
+                pass
+            disk_bytes -= size
+
+
+class MelCache(SynthesisCache):
+    """
+    Sentence-level cache of postnet mels, so multi-line synthesis only decodes sentences it has not seen before.
+    Mels are stored as float16 in an in-memory LRU bounded by max_memory_bytes. When cache_dir is given,
+    entries evicted from memory spill to .npy files there. Hits on spilled entries read them through a memory map
+    and only convert them when used, so they are not loaded back into memory.
+    Safe to share between threads.
+
+    Parameters
+    ----------
+    model_id : str
+        Identity of the Tacotron2 model producing the mels (see checkpoint_id)
+    cache_dir : str (optional)
+        Directory to spill evicted mels to (default is memory only)
+    max_memory_bytes : int (optional)
+        Size cap of the in-memory tier (default is 64MB)
+    max_disk_bytes : int (optional)
+        Size cap of the spill directory (default is 512MB)
+    """
+
+    def __init__(self, model_id, cache_dir=None, max_memory_bytes=64 * 1024 * 1024, max_disk_bytes=512 * 1024 * 1024):
+        super(MelCache, self).__init__(model_id, cache_dir, max_disk_bytes=max_disk_bytes)
+        self.max_memory_bytes = max_memory_bytes
+        self.memory_bytes = 0
+
+    def get(self, key):
+        """
+        Fetches a cached mel. Spilled entries are read from their memory-mapped file.
+
+        Parameters
+        ----------
+        key : str
+            Cache key
+
+        Returns
+        -------
+        Tensor
+            float32 mel of shape (1, n_mel_channels, frames) or None on a miss
+        """
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                mel = self.memory[key]
+            elif self.cache_dir:
+                try:
+                    mel = np.load(self._path(key), mmap_mode="r")
+                    os.utime(self._path(key))
+                except FileNotFoundError:
+                    return None
+            else:
+                return None
+
+        return torch.from_numpy(mel.astype(np.float32)).unsqueeze(0)
+
+    def put(self, key, mel):
+        """
+        Stores a mel in memory as float16.
+
+        Parameters
+        ----------
+        key : str
+            Cache key
+        mel : Tensor
+            Mel of shape (1, n_mel_channels, frames)
+        """
+        data = mel.detach().squeeze(0).cpu().numpy().astype(np.float16)
+        with self.lock:
+            self._put_memory(key, data)
+
+    def _put_memory(self, key, data):
+        if key in self.memory:
+            self.memory_bytes -= self.memory[key].nbytes
+        self.memory[key] = data
+        self.memory.move_to_end(key)
+        self.memory_bytes += data.nbytes
+
+        # Always keep the newest entry, even if it is larger than the cap
+        while self.memory_bytes > self.max_memory_bytes and len(self.memory) > 1:
+            old_key, old_data = self.memory.popitem(last=False)
+            self.memory_bytes -= old_data.nbytes
+            if self.cache_dir:
+                self._spill(old_key, old_data)
+
+    def _spill(self, key, data):
+        path = self._path(key)
+        if os.path.isfile(path):
+            return
+
+        tmp_path = self._tmp_path(key)
+        with open(tmp_path, "wb") as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+        self._evict_disk()
@@ -0,0 +1,166 @@
+import io
+import math
+import struct
+
+import numpy as np
+from scipy.signal import resample_poly
+
+from synthesis.vocoders.vocoder import MAX_WAV_VALUE
+
+AUDIO_FORMATS = ["wav", "flac", "opus"]
+AUDIO_EXTENSIONS = {"wav": ".wav", "flac": ".flac", "opus": ".ogg"}
+# Opus only supports these sample rates
+OPUS_SAMPLE_RATES = [8000, 12000, 16000, 24000, 48000]
+
+
+def _segments(audio):
+    return audio if isinstance(audio, list) else [audio]
+
+
+def encode_wav(sample_rate, audio):
+    """
+    Builds an in-memory 16-bit mono WAV file.
+    Segments are written straight into the buffer after the header, so they are copied once.
+
+    Parameters
+    ----------
+    sample_rate : int
+        Audio sample rate
+    audio : np.array/list
+        int16 audio data (or list of segments to write back to back)
+
+    Returns
+    -------
+    io.BytesIO
+        WAV file, positioned at the start
+    """
+    segments = _segments(audio)
+    data_size = sum(segment.nbytes for segment in segments)
+
+    buffer = io.BytesIO()
+    buffer.write(
+        struct.pack(
+            "<4sI4s4sIHHIIHH4sI",
+            b"RIFF",
+            36 + data_size,
+            b"WAVE",
+            b"fmt ",
+            16,  # fmt chunk size
+            1,  # PCM
+            1,  # Mono
+            sample_rate,
+            sample_rate * 2,  # Byte rate
+            2,  # Block align
+            16,  # Bits per sample
+            b"data",
+            data_size,
+        )
+    )
+    for segment in segments:
+        buffer.write(np.ascontiguousarray(segment, dtype="<i2"))
+    buffer.seek(0)
+    return buffer
+
+
+def encode_flac(sample_rate, audio):
+    """
+    Builds an in-memory FLAC file (lossless).
+    Segments are encoded one at a time. Requires the soundfile package.
+
+    Parameters
+    ----------
+    sample_rate : int
+        Audio sample rate
+    audio : np.array/list
+        int16 audio data (or list of segments to write back to back)
+
+    Returns
+    -------
+    io.BytesIO
+        FLAC file, positioned at the start
+    """
+    import soundfile
+
+    buffer = io.BytesIO()
+    with soundfile.SoundFile(buffer, "w", samplerate=sample_rate, channels=1, format="FLAC", subtype="PCM_16") as f:
+        for segment in _segments(audio):
+            f.write(segment)
+    buffer.seek(0)
+    return buffer
+
+
+def encode_opus(sample_rate, audio, compression_level=0.9):
+    """
+    Builds an in-memory Opus file in an OGG container (lossy, for voice).
+    Opus only supports a few sample rates, so audio is resampled up to the nearest one.
+    Segments are joined and resampled in one pass, so the resampling filter doesn't ring at their boundaries.
+    Requires the soundfile package (0.12 or newer).
+
+    Parameters
+    ----------
+    sample_rate : int
+        Audio sample rate
+    audio : np.array/list
+        int16 audio data (or list of segments to write back to back)
+    compression_level : float (optional)
+        0 (highest bitrate) to 1 (lowest bitrate). 0.9 is about 30 kbps, plenty for speech (default is 0.9)
+
+    Returns
+    -------
+    io.BytesIO
+        OGG file, positioned at the start
+    """
+    import soundfile
+
+    opus_sample_rate = min([rate for rate in OPUS_SAMPLE_RATES if rate >= sample_rate] or [OPUS_SAMPLE_RATES[-1]])
+    divisor = math.gcd(opus_sample_rate, sample_rate)
+    up, down = opus_sample_rate // divisor, sample_rate // divisor
+
+    buffer = io.BytesIO()
+    with soundfile.SoundFile(
+        buffer,
+        "w",
+        samplerate=opus_sample_rate,
+        channels=1,
+        format="OGG",
+        subtype="OPUS",
+        compression_level=compression_level,
+    ) as f:
+        if up != down:
+            audio = np.concatenate(_segments(audio)).astype(np.float32) / MAX_WAV_VALUE
+            f.write(resample_poly(audio, up, down).astype(np.float32))
+        else:
+            for segment in _segments(audio):
+                f.write(segment)
+    buffer.seek(0)
+    return buffer
+
+
+ENCODERS = {"wav": encode_wav, "flac": encode_flac, "opus": encode_opus}
+
+
+def encode_audio(sample_rate, audio, audio_format="wav"):
+    """
+    Encodes audio in the given format.
+
+    Parameters
+    ----------
+    sample_rate : int
+        Audio sample rate
+    audio : np.array/list
+        int16 audio data (or list of segments to write back to back)
+    audio_format : str (optional)
+        One of AUDIO_FORMATS (default is "wav")
+
+    Returns
+    -------
+    io.BytesIO
+        Encoded file, positioned at the start
+
+    Raises
+    -------
+    AssertionError
+        If the format is unknown
+    """
+    assert audio_format in ENCODERS, "Unknown audio format %s" % audio_format
+    return ENCODERS[audio_format](sample_rate, audio)
@@ -0,0 +1,117 @@
+import argparse
+import json
+import os
+from os.path import dirname, abspath
+import sys
+
+import torch
+
+sys.path.append(dirname(dirname(abspath(__file__))))
+
+from training.tacotron2_model import Tacotron2
+from training.tacotron2_model.model import fold_batch_norm
+from training.tacotron2_model.scripted import script_model
+from synthesis.vocoders.hifigan import AttrDict
+from synthesis.vocoders.hifigan_model import Generator
+
+SCRIPTED_MODEL_EXTENSION = ".jit"
+ONNX_MODEL_EXTENSION = ".onnx"
+
+
+def export_torchscript(model_path, output_path=None):
+    """
+    Exports a Tacotron2 checkpoint as a TorchScript module.
+    load_model prefers this export when it is saved as model_path + ".jit".
+
+    Parameters
+    ----------
+    model_path : str
+        Path to tacotron2 model
+    output_path : str (optional)
+        Path to save the scripted model to (default is model_path + ".jit")
+
+    Returns
+    -------
+    str
+        Path of the saved export
+    """
+    if not output_path:
+        output_path = model_path + SCRIPTED_MODEL_EXTENSION
+
+    model = Tacotron2()
+    model.load_state_dict(torch.load(model_path, map_location=torch.device("cpu"))["state_dict"])
+    fold_batch_norm(model.eval())
+
+    scripted = script_model(model)
+    scripted.save(output_path)
+    return output_path
+
+
+def export_onnx(model_path, config_path, output_path=None, opset_version=13):
+    """
+    Exports the Hifigan generator (with weight norm removed) to ONNX.
+    The batch and time axes are dynamic so any mel length can be vocoded.
+
+    Parameters
+    ----------
+    model_path : str
+        Path to hifigan model
+    config_path : str
+        Path to hifigan config
+    output_path : str (optional)
+        Path to save the ONNX model to (default is model_path + ".onnx")
+    opset_version : int (optional)
+        ONNX opset to target (default is 13)
+
+    Returns
+    -------
+    str
+        Path of the saved export
+    """
+    if not output_path:
+        output_path = model_path + ONNX_MODEL_EXTENSION
+
+    with open(config_path) as f:
+        h = AttrDict(json.loads(f.read()))
+
+    generator = Generator(h)
+    generator.load_state_dict(torch.load(model_path, map_location=torch.device("cpu"))["generator"])
+    generator.eval()
+    generator.remove_weight_norm()
+
+    dummy_mel = torch.randn(1, h.num_mels, 64)
+    with torch.no_grad():
+        torch.onnx.export(
+            generator,
+            dummy_mel,
+            output_path,
+            input_names=["mel"],
+            output_names=["audio"],
+            dynamic_axes={"mel": {0: "batch", 2: "frames"}, "audio": {0: "batch", 2: "samples"}},
+            opset_version=opset_version,
+        )
+    return output_path
+
+
+if __name__ == "__main__":
+    """Script to export models for faster inference"""
+    parser = argparse.ArgumentParser(description="Export models for inference")
+    subparsers = parser.add_subparsers(dest="format", required=True)
+
+    torchscript_parser = subparsers.add_parser("torchscript", help="Export Tacotron2 with TorchScript")
+    torchscript_parser.add_argument("-m", "--model", help="Tacotron2 model path", type=str, required=True)
+    torchscript_parser.add_argument("-o", "--output", help="Output path (default is model path + .jit)", type=str)
+
+    onnx_parser = subparsers.add_parser("onnx", help="Export the Hifigan vocoder to ONNX")
+    onnx_parser.add_argument("-vm", "--vocoder_model", help="Hifigan model path", type=str, required=True)
+    onnx_parser.add_argument("-hc", "--hifigan_config", help="Hifigan config path", type=str, required=True)
+    onnx_parser.add_argument("-o", "--output", help="Output path (default is model path + .onnx)", type=str)
+
+    args = parser.parse_args()
+
+    if args.format == "torchscript":
+        assert os.path.isfile(args.model), "Model not found"
+        print("Saved TorchScript model to %s" % export_torchscript(args.model, args.output))
+    elif args.format == "onnx":
+        assert os.path.isfile(args.vocoder_model), "Vocoder model not found"
+        print("Saved ONNX model to %s" % export_onnx(args.vocoder_model, args.hifigan_config, args.output))
@@ -0,0 +1,113 @@
+import argparse
+import os
+from os.path import dirname, abspath
+import sys
+
+import numpy as np
+import torch
+from torch import nn
+
+sys.path.append(dirname(dirname(abspath(__file__))))
+
+from training.clean_text import clean_text
+from training import DEFAULT_ALPHABET
+
+
+def quantize_model(model):
+    """
+    Applies dynamic int8 quantization to the LSTM, LSTMCell and Linear layers of a Tacotron2 model.
+    Weights are stored as int8 and activations are quantized on the fly, which speeds up
+    the LSTM matmuls that dominate CPU inference. CPU only.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Loaded tacotron2 model (fp32, on CPU)
+
+    Returns
+    -------
+    Tacotron2
+        Quantized tacotron2 model
+    """
+    return torch.quantization.quantize_dynamic(model, {nn.LSTM, nn.LSTMCell, nn.Linear}, dtype=torch.qint8)
+
+
+def compare_outputs(model, quantized_model, vocoder, quantized_vocoder, text, symbols=DEFAULT_ALPHABET, seed=1234):
+    """
+    Reports how far quantized inference drifts from fp32 inference.
+    Both Tacotron2 models are run with the same seed so their prenet dropout matches,
+    and both vocoders are given the same fp32 mel so vocoder error is measured on its own.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        fp32 tacotron2 model
+    quantized_model : Tacotron2
+        Quantized tacotron2 model
+    vocoder : Object
+        fp32 vocoder
+    quantized_vocoder : Object
+        Quantized or bf16 vocoder
+    text : str
+        Text to synthesize
+    symbols : list (optional)
+        List of symbols (default is English)
+    seed : int (optional)
+        Random seed used for both runs (default is 1234)
+
+    Returns
+    -------
+    dict
+        Mel lengths, mel mean/max absolute error and waveform SNR in dB
+    """
+    symbol_to_id = {s: i for i, s in enumerate(symbols)}
+    sequence = torch.LongTensor([[symbol_to_id[s] for s in clean_text(text, symbols) if s in symbol_to_id]])
+
+    with torch.no_grad():
+        torch.manual_seed(seed)
+        _, mel, _, _ = model.inference(sequence, return_alignments=False)
+        torch.manual_seed(seed)
+        _, quantized_mel, _, _ = quantized_model.inference(sequence, return_alignments=False)
+
+    # The gate may fire on a different frame, so compare the overlapping frames
+    frames = min(mel.size(2), quantized_mel.size(2))
+    mel_error = (mel[:, :, :frames].float() - quantized_mel[:, :, :frames].float()).abs()
+
+    audio = vocoder.generate_audio(mel).astype(np.float64)
+    quantized_audio = quantized_vocoder.generate_audio(mel).astype(np.float64)
+    noise = np.sum((audio - quantized_audio) ** 2)
+    snr = 10 * np.log10(np.sum(audio**2) / noise) if noise > 0 else float("inf")
+
+    return {
+        "mel_frames": mel.size(2),
+        "quantized_mel_frames": quantized_mel.size(2),
+        "mel_mean_abs_error": mel_error.mean().item(),
+        "mel_max_abs_error": mel_error.max().item(),
+        "waveform_snr_db": snr,
+    }
+
+
+if __name__ == "__main__":
+    """Script to check quantized inference quality against fp32"""
+    from synthesis.synthesize import load_model, load_vocoder
+
+    parser = argparse.ArgumentParser(description="Compare quantized CPU inference against fp32")
+    parser.add_argument("-m", "--model", help="Tacotron2 model path", type=str, required=True)
+    parser.add_argument("-vm", "--vocoder_model", help="Hifigan model path", type=str, required=True)
+    parser.add_argument("-hc", "--hifigan_config", help="Hifigan config path", type=str, required=True)
+    parser.add_argument("-t", "--text", help="Text to synthesize", type=str, required=True)
+    parser.add_argument("-p", "--precision", help="Vocoder precision to compare", type=str, default="bf16")
+    args = parser.parse_args()
+
+    assert os.path.isfile(args.model), "Model not found"
+    assert not torch.cuda.is_available(), "Quantized inference is CPU only"
+
+    report = compare_outputs(
+        load_model(args.model, prefer_scripted=False),
+        load_model(args.model, prefer_scripted=False, quantize=True),
+        load_vocoder(args.vocoder_model, args.hifigan_config),
+        load_vocoder(args.vocoder_model, args.hifigan_config, precision=args.precision),
+        args.text,
+    )
+    for key, value in report.items():
+        print("%s: %s" % (key, value))
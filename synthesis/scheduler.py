@@ -0,0 +1,210 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import defaultdict, deque
+
+
+class SchedulerRejected(Exception):
+    """
+    Raised when a job is refused by admission control.
+    The message explains why and can be shown to the user.
+    """
+
+
+class SynthesisScheduler:
+    """
+    Queues synthesis jobs in front of an executor.
+    At most max_in_flight jobs run at once and the rest wait in a queue ordered shortest-first,
+    so short messages are not stuck behind long ones. Waiting jobs age so long ones still get their turn.
+    Jobs are rejected up front when a user or guild is over its concurrency or rate limit,
+    when the queue is full, or when the estimated wait is longer than the deadline.
+    Must be used from a single event loop.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        Executor to run jobs in
+    max_in_flight : int (optional)
+        Number of jobs running at once (default is 2)
+    max_queued : int (optional)
+        Number of jobs waiting to run (default is 32)
+    max_per_user : int (optional)
+        Number of queued or running jobs per user (default is 2)
+    max_per_guild : int (optional)
+        Number of queued or running jobs per guild (default is 4)
+    user_rate : int (optional)
+        Number of jobs a user can submit per rate_period (default is 10)
+    guild_rate : int (optional)
+        Number of jobs a guild can submit per rate_period (default is 30)
+    rate_period : float (optional)
+        Rate limit window in seconds (default is 60)
+    deadline : float (optional)
+        Longest estimated queue wait in seconds before a job is rejected (default is 60)
+    aging : float (optional)
+        Cost units a job gains priority by for every second it waits (default is 10)
+    seconds_per_cost : float (optional)
+        Initial estimate of run time per cost unit, refined as jobs finish (default is 0.05)
+    """
+
+    def __init__(
+        self,
+        executor,
+        max_in_flight=2,
+        max_queued=32,
+        max_per_user=2,
+        max_per_guild=4,
+        user_rate=10,
+        guild_rate=30,
+        rate_period=60.0,
+        deadline=60.0,
+        aging=10.0,
+        seconds_per_cost=0.05,
+    ):
+        self.executor = executor
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.max_per_user = max_per_user
+        self.max_per_guild = max_per_guild
+        self.user_rate = user_rate
+        self.guild_rate = guild_rate
+        self.rate_period = rate_period
+        self.deadline = deadline
+        self.aging = aging
+        self.seconds_per_cost = seconds_per_cost
+
+        self.queue = []
+        self.counter = itertools.count()
+        self.in_flight = 0
+        self.in_flight_cost = 0
+        self.active = defaultdict(int)
+        self.history = defaultdict(deque)
+
+    def _within_rate(self, key, limit, now):
+        history = self.history.get(key)
+        if history is None:
+            return True
+        while history and now - history[0] > self.rate_period:
+            history.popleft()
+        if not history:
+            del self.history[key]
+            return True
+        return len(history) < limit
+
+    def estimate_wait(self, priority):
+        """
+        Estimates how long a job with the given priority would wait to start.
+
+        Parameters
+        ----------
+        priority : float
+            Queue priority of the job (lower runs first)
+
+        Returns
+        -------
+        float
+            Estimated wait in seconds
+        """
+        if self.in_flight < self.max_in_flight and not self.queue:
+            return 0.0
+
+        ahead = sum(job[2] for job in self.queue if job[0] <= priority)
+        # Running jobs are on average half done
+        work = ahead + self.in_flight_cost / 2
+        return work * self.seconds_per_cost / self.max_in_flight
+
+    def submit(self, func, cost, user, guild=None, timed=True):
+        """
+        Queues a job, or rejects it straight away.
+
+        Parameters
+        ----------
+        func : callable
+            Job to run in the executor (takes no arguments)
+        cost : int
+            Relative job size (e.g. cleaned text length)
+        user : hashable
+            User submitting the job
+        guild : hashable (optional)
+            Guild the job was submitted from (default is None for direct messages)
+        timed : bool (optional)
+            Whether the job's run time refines the wait estimates. Turn off for jobs whose run time
+            is not set by their cost, such as ones paced by real-time playback (default is True)
+
+        Returns
+        -------
+        asyncio.Future
+            Resolves to the job's return value
+
+        Raises
+        -------
+        SchedulerRejected
+            If the job is refused by admission control
+        """
+        now = time.monotonic()
+        limits = [(("user", user), self.max_per_user, self.user_rate)]
+        if guild is not None:
+            limits.append((("guild", guild), self.max_per_guild, self.guild_rate))
+
+        # Cancelled jobs stay queued until they would be dispatched, so drop them before counting
+        if any(job[4].cancelled() for job in self.queue):
+            self.queue = [job for job in self.queue if not job[4].cancelled()]
+            heapq.heapify(self.queue)
+
+        if len(self.queue) >= self.max_queued:
+            raise SchedulerRejected("Too many messages are queued, please try again later")
+        for key, concurrency, rate in limits:
+            if self.active.get(key, 0) >= concurrency:
+                raise SchedulerRejected("Please wait for your earlier messages to finish")
+            if not self._within_rate(key, rate, now):
+                raise SchedulerRejected("Rate limit reached, please try again later")
+
+        # Shortest first, but every second spent waiting is worth `aging` units of cost
+        priority = now * self.aging + cost
+        wait = self.estimate_wait(priority)
+        if wait > self.deadline:
+            raise SchedulerRejected("Too busy right now (estimated wait %d seconds), please try again later" % wait)
+
+        keys = [key for key, _, _ in limits]
+        for key in keys:
+            self.history[key].append(now)
+            self.active[key] += 1
+
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda _: self._release(keys))
+        heapq.heappush(self.queue, (priority, next(self.counter), cost, func, future, timed))
+        self._dispatch()
+        return future
+
+    def _release(self, keys):
+        for key in keys:
+            self.active[key] -= 1
+            if not self.active[key]:
+                del self.active[key]
+
+    def _dispatch(self):
+        while self.in_flight < self.max_in_flight and self.queue:
+            _, _, cost, func, future, timed = heapq.heappop(self.queue)
+            if future.cancelled():
+                continue
+            self.in_flight += 1
+            self.in_flight_cost += cost
+            asyncio.get_running_loop().create_task(self._run(func, cost, future, timed))
+
+    async def _run(self, func, cost, future, timed):
+        start = time.monotonic()
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self.executor, func)
+            if not future.cancelled():
+                future.set_result(result)
+        except Exception as e:
+            if not future.cancelled():
+                future.set_exception(e)
+        finally:
+            if timed:
+                # Moving average of run time per unit of cost for wait estimates
+                duration = time.monotonic() - start
+                self.seconds_per_cost = 0.8 * self.seconds_per_cost + 0.2 * duration / max(cost, 1)
+            self.in_flight -= 1
+            self.in_flight_cost -= cost
+            self._dispatch()
@@ -0,0 +1,160 @@
+import queue
+import threading
+from concurrent.futures import Future
+from time import time
+
+import torch
+
+from training import DEFAULT_ALPHABET
+from training.clean_text import clean_text
+from synthesis.synthesize import text_to_sequences
+
+
+class BatchingServer:
+    """
+    Long-lived synthesis service that batches sentences across concurrent requests.
+    A background thread collects sentences for up to `window` seconds (or until max_batch_size are waiting),
+    decodes them with one Tacotron2 inference_batch call and vocodes them as one padded batch,
+    then hands each caller back its own audio.
+    Callers block in generate, so it is meant to be shared by worker threads.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Tacotron2 model
+    vocoder : Object
+        Vocoder model
+    symbols : list (optional)
+        List of symbols (default is English)
+    max_decoder_steps : int (optional)
+        Max decoder steps (default is 3000)
+    max_batch_size : int (optional)
+        Most sentences synthesized together (default is 8)
+    window : float (optional)
+        Seconds to wait for more sentences after the first arrives (default is 0.005)
+    mel_cache : MelCache (optional)
+        Sentence-level cache of postnet mels. Cached sentences skip Tacotron2
+    """
+
+    def __init__(
+        self,
+        model,
+        vocoder,
+        symbols=DEFAULT_ALPHABET,
+        max_decoder_steps=3000,
+        max_batch_size=8,
+        window=0.005,
+        mel_cache=None,
+    ):
+        self.model = model
+        self.vocoder = vocoder
+        self.symbols = symbols
+        self.max_decoder_steps = max_decoder_steps
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.mel_cache = mel_cache
+
+        self.requests = queue.Queue()
+        self.closed = False
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def generate(self, lines):
+        """
+        Synthesizes lines, batched with any other lines submitted at the same time.
+
+        Parameters
+        ----------
+        lines : list
+            List of lines to synthesize
+
+        Returns
+        -------
+        list
+            int16 audio for each line in order
+
+        Raises
+        -------
+        AssertionError
+            If the server has been closed or a line has no text left after cleaning
+        """
+        assert not self.closed, "Server is closed"
+        texts = [clean_text(line, self.symbols) for line in lines]
+        for line, text in zip(lines, texts):
+            assert text, "Nothing to synthesize in '%s'" % line
+
+        futures = []
+        for text in texts:
+            future = Future()
+            self.requests.put((text, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def close(self):
+        """
+        Finishes the queued sentences and stops the background thread.
+        """
+        self.closed = True
+        self.requests.put(None)
+        self.thread.join()
+
+    def _serve(self):
+        while True:
+            item = self.requests.get()
+            if item is None:
+                return
+
+            batch = [item]
+            end_time = time() + self.window
+            while len(batch) < self.max_batch_size:
+                try:
+                    item = self.requests.get(timeout=max(end_time - time(), 0))
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._run(batch)
+                    return
+                batch.append(item)
+
+            self._run(batch)
+
+    def _run(self, batch):
+        texts = [text for text, _ in batch]
+        try:
+            with torch.inference_mode():
+                mels = self._infer(texts)
+                audio = self.vocoder.generate_audio_batch(mels)
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+            else:
+                # Retry one at a time so a bad sentence only fails its own request
+                for item in batch:
+                    self._run([item])
+            return
+
+        for (_, future), audio_line in zip(batch, audio):
+            future.set_result(audio_line)
+
+    def _infer(self, texts):
+        mels = [None] * len(texts)
+        keys = None
+        if self.mel_cache is not None:
+            keys = [
+                self.mel_cache.key(text, symbols="".join(self.symbols), max_decoder_steps=self.max_decoder_steps)
+                for text in texts
+            ]
+            mels = [self.mel_cache.get(key) for key in keys]
+
+        pending = [i for i, mel in enumerate(mels) if mel is None]
+        if pending:
+            sequences, input_lengths = text_to_sequences([texts[i] for i in pending], self.symbols)
+            _, mel_outputs_postnet, _, _, output_lengths = self.model.inference_batch(
+                sequences, input_lengths, self.max_decoder_steps, False
+            )
+            for j, i in enumerate(pending):
+                mels[i] = mel_outputs_postnet[j : j + 1, :, : int(output_lengths[j])]
+                if keys is not None:
+                    self.mel_cache.put(keys[i], mels[i])
+
+        return mels
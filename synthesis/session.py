@@ -0,0 +1,108 @@
+import torch
+
+from training.tacotron2_model import Tacotron2
+from training.tacotron2_model.model import fuse_decoder_weights
+from synthesis.synthesize import synthesize, synthesize_stream
+
+
+class InferenceSession:
+    """
+    Owns the loaded models and the shared serving state, and runs synthesis requests against them.
+    Models are switched to eval mode (BatchNorm uses its running statistics and dropout is off outside the prenet),
+    and every request runs under torch.inference_mode so no autograd state is recorded.
+    The fused decoder weights are computed once here instead of on every request.
+    Requests only read the models, so one session can be shared between threads.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Tacotron2 model
+    vocoder : Object
+        Vocoder model
+    cache : SynthesisCache (optional)
+        Cache of finished clips
+    mel_cache : MelCache (optional)
+        Sentence-level cache of postnet mels
+    server : BatchingServer (optional)
+        Batching server to send sentences to
+    pool : WorkerPool (optional)
+        Worker processes to run requests in. Workers hold their own models and caches
+    """
+
+    def __init__(self, model, vocoder, cache=None, mel_cache=None, server=None, pool=None):
+        self.model = model
+        self.vocoder = vocoder
+        self.cache = cache
+        self.mel_cache = mel_cache
+        self.server = server
+        self.pool = pool
+
+        self.model.eval()
+        if isinstance(getattr(vocoder, "model", None), torch.nn.Module):
+            vocoder.model.eval()
+        # Scripted models keep their own copy, and WorkerPool may have fused them already
+        if isinstance(model, Tacotron2) and model.decoder.fused_weights is None:
+            model.decoder.fused_weights = fuse_decoder_weights(model.decoder)
+
+    def run(self, text, **kwargs):
+        """
+        Synthesizes text.
+        Takes the same arguments as synthesize, apart from the models and shared state.
+
+        Parameters
+        ----------
+        text : str/list
+            Text to synthesize (or list of lines to synthesize)
+
+        Returns
+        -------
+        io.BytesIO
+            Encoded audio if return_audio is set, otherwise None
+        """
+        if self.pool is not None:
+            return self.pool.synthesize(text=text, **kwargs)
+
+        with torch.inference_mode():
+            return synthesize(
+                model=self.model,
+                text=text,
+                vocoder=self.vocoder,
+                cache=self.cache,
+                mel_cache=self.mel_cache,
+                server=self.server,
+                **kwargs
+            )
+
+    def stream(self, text, **kwargs):
+        """
+        Synthesizes text, yielding audio while the decoder is still running.
+        Takes the same arguments as synthesize_stream, apart from the models.
+        Always runs in this process.
+
+        Parameters
+        ----------
+        text : str/list
+            Text to synthesize (or list of lines to synthesize)
+
+        Yields
+        -------
+        np.array
+            int16 audio chunks
+        """
+        chunks = synthesize_stream(self.model, text, self.vocoder, **kwargs)
+        while True:
+            # Only the synthesis itself runs in inference mode, not the caller's code between chunks
+            with torch.inference_mode():
+                audio = next(chunks, None)
+            if audio is None:
+                return
+            yield audio
+
+    def close(self):
+        """
+        Stops the batching server and worker processes.
+        """
+        if self.server is not None:
+            self.server.close()
+        if self.pool is not None:
+            self.pool.close()
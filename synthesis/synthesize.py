@@ -1,7 +1,9 @@
+import io
 import os
+import queue
+import threading
 import torch
 import numpy as np
-from scipy.io.wavfile import write
 from os.path import dirname, abspath
 import sys
 from time import time
@@ -13,35 +15,126 @@ nltk.download("punkt")
 sys.path.append(dirname(dirname(abspath(__file__))))
 
 from training.tacotron2_model import Tacotron2
+from training.tacotron2_model.model import fold_batch_norm
 from training.clean_text import clean_text
 from training import DEFAULT_ALPHABET
-from synthesis.vocoders import Hifigan
+from synthesis.vocoders import Hifigan, HifiganOnnx, GriffinLimVocoder
+from synthesis.quantize import quantize_model
+from synthesis.export import SCRIPTED_MODEL_EXTENSION, ONNX_MODEL_EXTENSION
+from synthesis.encoders import encode_audio
 
-def load_model(model_path):
+VOCODER_BACKENDS = ["torch", "onnx", "griffin_lim"]
+
+
+def resolve_model_path(model_path, prefer_scripted=True):
+    """
+    Finds the file load_model loads for a checkpoint.
+    This is the TorchScript export next to the checkpoint when there is one, so caches can be keyed on it.
+
+    Parameters
+    ----------
+    model_path : str
+        Path to tacotron2 model
+    prefer_scripted : bool (optional)
+        Whether the TorchScript export is preferred when one is present (default is True)
+
+    Returns
+    -------
+    str
+        Path of the file load_model loads
+    """
+    scripted_path = model_path + SCRIPTED_MODEL_EXTENSION
+    if prefer_scripted and os.path.isfile(scripted_path):
+        return scripted_path
+    return model_path
+
+
+def load_model(model_path, prefer_scripted=True, quantize=False):
     """
     Loads the Tacotron2 model.
     Uses GPU if available, otherwise uses CPU.
+    If a TorchScript export of the model exists next to the checkpoint
+    (model_path + ".jit", see synthesis/export.py) it is loaded instead.
+    The encoder and postnet BatchNorm layers are folded into their convolutions,
+    so the returned model is for inference only.
+    Scripted models support synthesize() but not synthesize_stream().
 
     Parameters
     ----------
     model_path : str
         Path to tacotron2 model
+    prefer_scripted : bool (optional)
+        Whether to load the TorchScript export when one is present (default is True)
+    quantize : bool (optional)
+        Whether to apply dynamic int8 quantization on CPU (see synthesis/quantize.py).
+        Ignored for scripted models and on GPU (default is False)
 
     Returns
     -------
     Tacotron2
         Loaded tacotron2 model
     """
+    scripted_path = resolve_model_path(model_path, prefer_scripted)
+    if scripted_path != model_path:
+        if torch.cuda.is_available():
+            model = torch.jit.load(scripted_path, map_location=torch.device("cuda"))
+            _ = model.eval().half()
+        else:
+            model = torch.jit.load(scripted_path, map_location=torch.device("cpu"))
+        return model
+
     if torch.cuda.is_available():
         model = Tacotron2().cuda()
         model.load_state_dict(torch.load(model_path)["state_dict"])
-        _ = model.cuda().eval().half()
+        _ = fold_batch_norm(model.cuda().eval()).half()
     else:
         model = Tacotron2()
         model.load_state_dict(torch.load(model_path, map_location=torch.device("cpu"))["state_dict"])
+        _ = fold_batch_norm(model.eval())
+        if quantize:
+            model = quantize_model(model)
     return model
 
 
+def load_vocoder(model_path, config_path, backend="torch", precision="fp32", tile_frames=None):
+    """
+    Loads the Hifigan vocoder with the given backend.
+
+    Parameters
+    ----------
+    model_path : str
+        Path to hifigan model
+    config_path : str
+        Path to hifigan config
+    backend : str (optional)
+        "torch" runs the PyTorch generator, "onnx" runs the ONNX export (model_path + ".onnx",
+        see synthesis/export.py) with ONNX Runtime on CPU, "griffin_lim" skips the model and estimates phase
+        with Griffin-Lim (much faster, lower quality) (default is "torch")
+    precision : str (optional)
+        "fp32" or "bf16" for the torch backend on CPU (default is "fp32")
+    tile_frames : int (optional)
+        Vocode long mels in tiles of this many frames to bound memory use (torch backend only, default is off)
+
+    Returns
+    -------
+    Vocoder
+        Loaded vocoder
+
+    Raises
+    -------
+    AssertionError
+        If the backend is unknown
+    """
+    assert backend in VOCODER_BACKENDS, "Unknown vocoder backend %s" % backend
+    if backend == "onnx":
+        if not model_path.endswith(ONNX_MODEL_EXTENSION):
+            model_path += ONNX_MODEL_EXTENSION
+        return HifiganOnnx(model_path, config_path)
+    if backend == "griffin_lim":
+        return GriffinLimVocoder()
+    return Hifigan(model_path, config_path, precision, tile_frames)
+
+
 def text_to_sequence(text, symbols):
     """
     Generates text sequence for audio file
@@ -61,6 +154,292 @@ def text_to_sequence(text, symbols):
         return torch.autograd.Variable(torch.from_numpy(sequence)).cpu().long()
 
 
+def text_to_sequences(texts, symbols):
+    """
+    Generates a zero-padded batch of text sequences for batched inference
+
+    Parameters
+    ----------
+    texts : list
+        List of cleaned texts to synthesize
+    symbols : list
+        List of valid symbols
+
+    Returns
+    -------
+    (Tensor, Tensor)
+        Padded sequences (batch, max length) and the length of each sequence
+    """
+    symbol_to_id = {s: i for i, s in enumerate(symbols)}
+    sequences = [[symbol_to_id[s] for s in text if s in symbol_to_id] for text in texts]
+    lengths = torch.LongTensor([len(sequence) for sequence in sequences])
+    padded = torch.zeros(len(sequences), int(lengths.max()), dtype=torch.long)
+    for i, sequence in enumerate(sequences):
+        padded[i, : len(sequence)] = torch.LongTensor(sequence)
+    if torch.cuda.is_available():
+        return padded.cuda(), lengths.cuda()
+    else:
+        return padded, lengths
+
+
+def iter_line_mels(
+    model,
+    lines,
+    symbols=DEFAULT_ALPHABET,
+    max_decoder_steps=3000,
+    batch_size=8,
+    return_alignments=False,
+    mel_cache=None,
+):
+    """
+    Runs Tacotron2 over several lines, yielding each mel as soon as its batch is decoded.
+    Lines are sorted by length and decoded in batches to keep padding small,
+    so mels are not yielded in line order. Lines found in mel_cache are yielded first without decoding.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Tacotron2 model
+    lines : list
+        List of lines to synthesize
+    symbols : list
+        List of symbols (default is English)
+    max_decoder_steps : int (optional)
+        Max decoder steps (default is 3000)
+    batch_size : int (optional)
+        Number of lines to decode together (default is 8)
+    return_alignments : bool (optional)
+        Whether to record attention alignments (default is False).
+        Cached mels have no alignment, so the cache is only written to when this is set
+    mel_cache : MelCache (optional)
+        Sentence-level cache of postnet mels
+
+    Yields
+    -------
+    (int, Tensor, Tensor)
+        Line index, trimmed postnet mel output and alignment (None unless return_alignments is set)
+    """
+    cleaned = [clean_text(line, symbols) for line in lines]
+    pending = list(range(len(cleaned)))
+
+    if mel_cache is not None:
+        keys = [mel_cache.key(line, symbols="".join(symbols), max_decoder_steps=max_decoder_steps) for line in cleaned]
+        if not return_alignments:
+            pending = []
+            for i, key in enumerate(keys):
+                mel = mel_cache.get(key)
+                if mel is None:
+                    pending.append(i)
+                else:
+                    yield i, mel, None
+
+    order = sorted(pending, key=lambda i: len(cleaned[i]))
+
+    for start in range(0, len(order), batch_size):
+        indexes = order[start : start + batch_size]
+        sequences, input_lengths = text_to_sequences([cleaned[i] for i in indexes], symbols)
+        _, mel_outputs_postnet, _, alignment, output_lengths = model.inference_batch(
+            sequences, input_lengths, max_decoder_steps, return_alignments
+        )
+        for j, i in enumerate(indexes):
+            mel_length = int(output_lengths[j])
+            mel = mel_outputs_postnet[j : j + 1, :, :mel_length]
+            if mel_cache is not None:
+                mel_cache.put(keys[i], mel)
+            yield (
+                i,
+                mel,
+                alignment[j : j + 1, :mel_length, : int(input_lengths[j])] if alignment is not None else None,
+            )
+
+
+def infer_lines(
+    model,
+    lines,
+    symbols=DEFAULT_ALPHABET,
+    max_decoder_steps=3000,
+    batch_size=8,
+    return_alignments=False,
+    mel_cache=None,
+):
+    """
+    Runs Tacotron2 over several lines at once.
+    Each mel is trimmed to its own length and returned in the original order.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Tacotron2 model
+    lines : list
+        List of lines to synthesize
+    symbols : list
+        List of symbols (default is English)
+    max_decoder_steps : int (optional)
+        Max decoder steps (default is 3000)
+    batch_size : int (optional)
+        Number of lines to decode together (default is 8)
+    return_alignments : bool (optional)
+        Whether to record attention alignments (default is False)
+    mel_cache : MelCache (optional)
+        Sentence-level cache of postnet mels
+
+    Returns
+    -------
+    (list, list)
+        Postnet mel outputs and alignments (None unless return_alignments is set) for each line
+    """
+    mels = [None] * len(lines)
+    alignments = [None] * len(lines)
+    for i, mel, alignment in iter_line_mels(
+        model, lines, symbols, max_decoder_steps, batch_size, return_alignments, mel_cache
+    ):
+        mels[i] = mel
+        alignments[i] = alignment
+
+    return mels, alignments
+
+
+def pipeline_lines(
+    model,
+    vocoder,
+    lines,
+    symbols=DEFAULT_ALPHABET,
+    max_decoder_steps=3000,
+    batch_size=1,
+    queue_size=2,
+    mel_cache=None,
+):
+    """
+    Generates audio for several lines with Tacotron2 and the vocoder running concurrently.
+    A background thread decodes mels into a bounded queue while the calling thread vocodes them,
+    so the vocoder works on one batch while Tacotron2 decodes the next.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Tacotron2 model
+    vocoder : Object
+        Vocoder model
+    lines : list
+        List of lines to synthesize
+    symbols : list
+        List of symbols (default is English)
+    max_decoder_steps : int (optional)
+        Max decoder steps (default is 3000)
+    batch_size : int (optional)
+        Number of lines to decode together. Smaller batches give the stages more to overlap (default is 1)
+    queue_size : int (optional)
+        Maximum number of decoded mels waiting for the vocoder (default is 2)
+    mel_cache : MelCache (optional)
+        Sentence-level cache of postnet mels
+
+    Returns
+    -------
+    list
+        int16 audio for each line in the original order
+    """
+    mel_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    done = object()
+
+    def decode():
+        try:
+            with torch.no_grad():
+                for item in iter_line_mels(model, lines, symbols, max_decoder_steps, batch_size, mel_cache=mel_cache):
+                    mel_queue.put(item)
+                    if stop.is_set():
+                        return
+            mel_queue.put(done)
+        except Exception as e:
+            mel_queue.put(e)
+
+    decoder_thread = threading.Thread(target=decode, daemon=True)
+    decoder_thread.start()
+
+    audio = [None] * len(lines)
+    try:
+        while True:
+            item = mel_queue.get()
+            if item is done:
+                break
+            elif isinstance(item, Exception):
+                raise item
+            i, mel, _ = item
+            audio[i] = vocoder.generate_audio(mel)
+    finally:
+        # Unblock the decoder if we are leaving early
+        stop.set()
+        while decoder_thread.is_alive():
+            try:
+                mel_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    return audio
+
+
+def interleave_silence(audio_lines, silence_padding=0.15, sample_rate=22050):
+    """
+    Puts silence between the audio of several lines.
+
+    Parameters
+    ----------
+    audio_lines : list
+        int16 audio for each line
+    silence_padding : float (optional)
+        Seconds of silence to seperate each clip by (default is 0.15)
+    sample_rate : int (optional)
+        Audio sample rate (default is 22050)
+
+    Returns
+    -------
+    list
+        Audio segments to play back to back
+    """
+    silence = np.zeros(int(silence_padding * sample_rate)).astype("int16")
+    audio_segments = []
+    for i in range(len(audio_lines)):
+        audio_segments.append(audio_lines[i])
+        if i != len(audio_lines) - 1:
+            audio_segments.append(silence)
+
+    return audio_segments
+
+
+def save_audio(audio_path, sample_rate, audio, cache=None, cache_key=None, audio_format="wav"):
+    """
+    Encodes audio, writing it to a file and storing it in the cache when given.
+
+    Parameters
+    ----------
+    audio_path : str
+        Path to save audio file to (None to only keep it in memory)
+    sample_rate : int
+        Audio sample rate
+    audio : np.array/list
+        int16 audio data (or list of segments to write back to back)
+    cache : SynthesisCache (optional)
+        Cache to store the file in
+    cache_key : str (optional)
+        Key to store the file under
+    audio_format : str (optional)
+        One of AUDIO_FORMATS (default is "wav")
+
+    Returns
+    -------
+    io.BytesIO
+        Encoded file, positioned at the start
+    """
+    buffer = encode_audio(sample_rate, audio, audio_format)
+    if audio_path:
+        with buffer.getbuffer() as data, open(audio_path, "wb") as f:
+            f.write(data)
+    if cache is not None:
+        # getvalue shares the buffer's bytes rather than copying them
+        cache.put(cache_key, buffer.getvalue())
+    return buffer
+
+
 def synthesize(
     model,
     text,
@@ -71,6 +450,14 @@ def synthesize(
     sample_rate=22050,
     max_decoder_steps=3000,
     split_text=False,
+    batch_size=8,
+    pipeline=True,
+    return_alignments=False,
+    cache=None,
+    mel_cache=None,
+    server=None,
+    return_audio=False,
+    audio_format="wav",
 ):
     """
     Synthesise text for a given model.
@@ -99,56 +486,273 @@ def synthesize(
     split_text : bool (optional)
         Whether to use the split text tool to convert a block of text into multiple shorter sentences
         to synthesize (default is True)
+    batch_size : int (optional)
+        Number of lines to decode together with multi-line synthesis.
+        When pipelining, batches are capped at half the lines so the vocoder can start
+        while the rest are decoded (default is 8)
+    pipeline : bool (optional)
+        Whether to vocode each decoded batch while Tacotron2 decodes the next
+        with multi-line synthesis (default is True)
+    return_alignments : bool (optional)
+        Whether to record the attention history of every decoder step.
+        Only needed for alignment graphs (default is False)
+    cache : SynthesisCache (optional)
+        Cache of finished audio files keyed on the cleaned text and synthesis parameters.
+        Hits skip Tacotron2 and the vocoder entirely
+    mel_cache : MelCache (optional)
+        Sentence-level cache of postnet mels used with multi-line synthesis.
+        Only sentences missing from it are decoded
+    server : BatchingServer (optional)
+        Shared synthesis service to batch this request's sentences with those of concurrent requests.
+        When given, model, vocoder, batch_size, pipeline and mel_cache are taken from the server
+    return_audio : bool (optional)
+        Whether to return the audio as an in-memory file.
+        audio_path is not needed in this case (default is False)
+    audio_format : str (optional)
+        Output format, one of AUDIO_FORMATS ("opus" gives the smallest files) (default is "wav")
+
+    Returns
+    -------
+    io.BytesIO
+        Audio file if return_audio is set, otherwise None
 
     Raises
     -------
     AssertionError
-        If audio_path is given without a vocoder
+        If audio is requested without a vocoder
     """
     print("Synthesizing audio...")
     
     start_time = time()
  
-    if audio_path:
+    output_audio = bool(audio_path) or return_audio
+    if output_audio:
         assert vocoder, "Missing vocoder"
 
     if not isinstance(text, list) and split_text:
         # Split text into multiple lines
         text = nltk.tokenize.sent_tokenize(text)
 
-    if isinstance(text, list):
+    cache_key = None
+    if cache is not None and output_audio:
+        lines = text if isinstance(text, list) else [text]
+        cache_key = cache.key(
+            "\n".join(clean_text(line.strip(), symbols) for line in lines if line.strip()),
+            symbols="".join(symbols),
+            multi_line=isinstance(text, list),
+            silence_padding=silence_padding,
+            sample_rate=sample_rate,
+            max_decoder_steps=max_decoder_steps,
+            audio_format=audio_format,
+        )
+        data = cache.get(cache_key)
+        if data is not None:
+            if audio_path:
+                with open(audio_path, "wb") as f:
+                    f.write(data)
+            print("Synthesis completed from cache in %s second(s)\n" % (time() - start_time))
+            return io.BytesIO(data) if return_audio else None
+
+    buffer = None
+    if server is not None and output_audio:
+        # Sentences are batched with those of other requests
+        lines = text if isinstance(text, list) else [text]
+        audio_lines = server.generate([line.strip() for line in lines if line.strip()])
+        audio = interleave_silence(audio_lines, silence_padding, sample_rate)
+        buffer = save_audio(audio_path, sample_rate, audio, cache, cache_key, audio_format)
+    elif isinstance(text, list):
         # Multi-lines given
         text = [line.strip() for line in text if line.strip()]
-        mels = []
-        alignments = []
-        for line in text:
-            text = clean_text(line, symbols)
-            sequence = text_to_sequence(text, symbols)
-            _, mel_outputs_postnet, _, alignment = model.inference(sequence, max_decoder_steps)
-            mels.append(mel_outputs_postnet)
-            alignments.append(alignment)
-
-        if audio_path:
-            silence = np.zeros(int(silence_padding * sample_rate)).astype("int16")
-            audio_segments = []
-            for i in range(len(mels)):
-                audio_segments.append(vocoder.generate_audio(mels[i]))
-                if i != len(mels) - 1:
-                    audio_segments.append(silence)
-
-            audio = np.concatenate(audio_segments)
-            write(audio_path, sample_rate, audio)
+        if output_audio and pipeline:
+            # Decode in at least two batches, otherwise there is nothing to vocode until everything is decoded
+            pipeline_batch_size = max(1, min(batch_size, len(text) // 2))
+            audio_lines = pipeline_lines(
+                model, vocoder, text, symbols, max_decoder_steps, pipeline_batch_size, mel_cache=mel_cache
+            )
+        else:
+            mels, alignments = infer_lines(
+                model, text, symbols, max_decoder_steps, batch_size, return_alignments, mel_cache
+            )
+            audio_lines = [vocoder.generate_audio(mel) for mel in mels] if output_audio else []
+
+        if output_audio:
+            audio = interleave_silence(audio_lines, silence_padding, sample_rate)
+            buffer = save_audio(audio_path, sample_rate, audio, cache, cache_key, audio_format)
     else:
         # Single sentence
         text = clean_text(text.strip(), symbols)
         sequence = text_to_sequence(text, symbols)
-        _, mel_outputs_postnet, _, alignment = model.inference(sequence, max_decoder_steps)
+        _, mel_outputs_postnet, _, alignment = model.inference(sequence, max_decoder_steps, return_alignments)
 
-        if audio_path:
+        if output_audio:
             audio = vocoder.generate_audio(mel_outputs_postnet)
-            write(audio_path, sample_rate, audio)
+            buffer = save_audio(audio_path, sample_rate, audio, cache, cache_key, audio_format)
             
     end_time = time()
     
     print("Synthesis completed in %s second(s)\n" % (end_time - start_time))
 
+    return buffer if return_audio else None
+
+
+def get_postnet_context(model):
+    """
+    Number of mel frames either side of a frame that affect its postnet output
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Tacotron2 model
+
+    Returns
+    -------
+    int
+        Postnet receptive field radius in frames
+    """
+    return sum(conv[0].conv.padding[0] for conv in model.postnet.convolutions)
+
+
+def _crossfade(tail, head):
+    """
+    Linearly crossfades two equal length int16 segments
+    """
+    fade = np.linspace(0.0, 1.0, len(tail), dtype=np.float32)
+    mixed = tail.astype(np.float32) * (1.0 - fade) + head.astype(np.float32) * fade
+    return mixed.astype("int16")
+
+
+@torch.no_grad()
+def stream_mel_to_audio(model, vocoder, mel_chunks, overlap=256):
+    """
+    Runs the postnet and vocoder over decoder mel chunks as they arrive.
+    Each window is vocoded with enough context for the postnet and vocoder receptive fields,
+    and neighbouring windows are crossfaded over a small overlap to hide seams.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Tacotron2 model (used for its postnet)
+    vocoder : Object
+        Vocoder model
+    mel_chunks : iterable
+        Decoder mel chunks of shape (1, n_mel_channels, frames), e.g. from Tacotron2.inference_stream
+    overlap : int (optional)
+        Number of samples to crossfade at chunk seams (default is 256)
+
+    Yields
+    -------
+    np.array
+        int16 audio chunks
+    """
+    postnet_context = get_postnet_context(model)
+    hop_length = vocoder.hop_length
+    overlap_frames = -(-overlap // hop_length)
+    lookahead = postnet_context + vocoder.context_frames + overlap_frames
+
+    frames = None
+    emitted = 0
+    tail = None
+
+    def vocode(start, end):
+        # Window of decoder frames needed to produce exact audio for [start, end)
+        num_frames = frames.size(2)
+        mel_start = max(0, start - vocoder.context_frames)
+        mel_end = min(num_frames, end + vocoder.context_frames)
+        post_start = max(0, mel_start - postnet_context)
+        post_end = min(num_frames, mel_end + postnet_context)
+        window = frames[:, :, post_start:post_end]
+        mel = window + model.postnet(window)
+        mel = mel[:, :, mel_start - post_start : mel_end - post_start]
+        audio = vocoder.generate_audio(mel)
+        return audio[(start - mel_start) * hop_length : (end - mel_start) * hop_length]
+
+    def stitch(audio, final):
+        nonlocal tail
+        if tail is not None:
+            audio = np.concatenate([_crossfade(tail, audio[: len(tail)]), audio[len(tail) :]])
+        if final:
+            tail = None
+            return audio
+        # Hold back the overlap so it can be crossfaded with the next chunk
+        tail = audio[len(audio) - overlap :]
+        return audio[: len(audio) - overlap]
+
+    for chunk in mel_chunks:
+        frames = chunk if frames is None else torch.cat((frames, chunk), dim=2)
+        ready = frames.size(2) - lookahead
+        if ready > emitted:
+            # The extra overlap frames are vocoded again (with more context) by the next window
+            yield stitch(vocode(emitted, ready + overlap_frames)[: (ready - emitted) * hop_length + overlap], False)
+            emitted = ready
+
+    if frames is not None and frames.size(2) > emitted:
+        yield stitch(vocode(emitted, frames.size(2)), True)
+    elif tail is not None:
+        yield tail
+
+
+def synthesize_stream(
+    model,
+    text,
+    vocoder,
+    symbols=DEFAULT_ALPHABET,
+    silence_padding=0.15,
+    sample_rate=22050,
+    max_decoder_steps=3000,
+    split_text=False,
+    chunk_size=32,
+    overlap=256,
+):
+    """
+    Synthesise text for a given model, yielding audio while the decoder is still running.
+    Time to first audio depends on chunk_size rather than the length of the text.
+    Scripted models (see synthesis/export.py) can only stream line by line.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Tacotron2 model
+    text : str/list
+        Text to synthesize (or list of lines to synthesize)
+    vocoder : Object
+        Vocoder model
+    symbols : list
+        List of symbols (default is English)
+    silence_padding : float (optional)
+        Seconds of silence to seperate each clip by with multi-line synthesis (default is 0.15)
+    sample_rate : int (optional)
+        Audio sample rate (default is 22050)
+    max_decoder_steps : int (optional)
+        Max decoder steps controls sequence length and memory usage during inference (default is 3000)
+    split_text : bool (optional)
+        Whether to use the split text tool to convert a block of text into multiple shorter sentences
+        to synthesize (default is False)
+    chunk_size : int (optional)
+        Number of decoder frames per chunk (default is 32)
+    overlap : int (optional)
+        Number of samples to crossfade at chunk seams (default is 256)
+
+    Yields
+    -------
+    np.array
+        int16 PCM audio chunks
+    """
+    if not isinstance(text, list) and split_text:
+        # Split text into multiple lines
+        text = nltk.tokenize.sent_tokenize(text)
+
+    lines = text if isinstance(text, list) else [text]
+    lines = [line.strip() for line in lines if line.strip()]
+    silence = np.zeros(int(silence_padding * sample_rate)).astype("int16")
+
+    for i, line in enumerate(lines):
+        if i != 0:
+            yield silence
+        sequence = text_to_sequence(clean_text(line, symbols), symbols)
+        if hasattr(model, "inference_stream"):
+            mel_chunks = model.inference_stream(sequence, max_decoder_steps, chunk_size)
+            yield from stream_mel_to_audio(model, vocoder, mel_chunks, overlap)
+        else:
+            # Scripted models can't stream, so each line is vocoded once it is decoded
+            _, mel_outputs_postnet, _, _ = model.inference(sequence, max_decoder_steps, False)
+            yield vocoder.generate_audio(mel_outputs_postnet)
@@ -1 +1,3 @@
 from synthesis.vocoders.hifigan import Hifigan  # noqa
+from synthesis.vocoders.hifigan_onnx import HifiganOnnx  # noqa
+from synthesis.vocoders.griffin_lim import GriffinLimVocoder  # noqa
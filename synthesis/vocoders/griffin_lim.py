@@ -0,0 +1,138 @@
+import math
+from functools import lru_cache
+
+import torch
+from librosa.filters import mel as librosa_mel_fn
+
+from synthesis.vocoders.vocoder import Vocoder, MAX_WAV_VALUE
+from training.tacotron2_model.audio_processing import dynamic_range_decompression
+
+
+@lru_cache(maxsize=4)
+def inverse_mel_basis(sampling_rate, filter_length, n_mel_channels, mel_fmin, mel_fmax):
+    """
+    Pseudo-inverse of the Tacotron2 mel filterbank (the same filters as TacotronSTFT.mel_basis).
+    Cached, so vocoders with the same audio config share one copy.
+
+    Parameters
+    ----------
+    sampling_rate : int
+        Audio sample rate
+    filter_length : int
+        FFT size
+    n_mel_channels : int
+        Number of mel channels
+    mel_fmin : float
+        Lowest mel frequency
+    mel_fmax : float
+        Highest mel frequency
+
+    Returns
+    -------
+    Tensor
+        Matrix of shape (filter_length // 2 + 1, n_mel_channels) mapping mels to linear magnitudes
+    """
+    mel_basis = librosa_mel_fn(
+        sr=sampling_rate, n_fft=filter_length, n_mels=n_mel_channels, fmin=mel_fmin, fmax=mel_fmax
+    )
+    return torch.linalg.pinv(torch.from_numpy(mel_basis).float())
+
+
+class GriffinLimVocoder(Vocoder):
+    """
+    Vocoder without a model, which estimates phase with fast Griffin-Lim (Griffin-Lim with momentum).
+    Much cheaper than Hifigan but noticeably lower quality, so it is meant as a fallback when Hifigan is overloaded.
+    Phases are refined over the whole clip, so audio vocoded piece by piece only approximately matches.
+    Padding would change the phases near the end of a clip, so batches are vocoded one mel at a time
+    and the same mel gives the same audio whatever it is batched with.
+
+    Parameters
+    ----------
+    n_iters : int (optional)
+        Number of Griffin-Lim iterations. More is slower but less phasey (default is 32)
+    momentum : float (optional)
+        Fast Griffin-Lim momentum, 0 for plain Griffin-Lim (default is 0.99)
+    power : float (optional)
+        Exponent applied to magnitudes before phase estimation. Above 1 reduces the background noise
+        but makes loud audio louder and can clip it (default is 1.0)
+    filter_length : int (optional)
+        FFT size the model was trained with (default is 1024)
+    hop_length : int (optional)
+        Samples per mel frame (default is 256)
+    win_length : int (optional)
+        Window length (default is 1024)
+    n_mel_channels : int (optional)
+        Number of mel channels (default is 80)
+    sampling_rate : int (optional)
+        Audio sample rate (default is 22050)
+    mel_fmin : float (optional)
+        Lowest mel frequency (default is 0)
+    mel_fmax : float (optional)
+        Highest mel frequency (default is 8000)
+    """
+
+    def __init__(
+        self,
+        n_iters=32,
+        momentum=0.99,
+        power=1.0,
+        filter_length=1024,
+        hop_length=256,
+        win_length=1024,
+        n_mel_channels=80,
+        sampling_rate=22050,
+        mel_fmin=0.0,
+        mel_fmax=8000.0,
+    ):
+        self.n_iters = n_iters
+        self.momentum = momentum
+        self.power = power
+        self.filter_length = filter_length
+        self.hop_length = hop_length
+        self.win_length = win_length
+        self.context_frames = filter_length // hop_length
+        self.inverse_basis = inverse_mel_basis(sampling_rate, filter_length, n_mel_channels, mel_fmin, mel_fmax)
+        self.window = torch.hann_window(win_length)
+
+    def generate_audio(self, mel_output):
+        with torch.no_grad():
+            magnitudes = torch.matmul(self.inverse_basis, dynamic_range_decompression(mel_output.float().cpu()))
+            magnitudes = magnitudes.clamp(min=0) ** self.power
+            audio = self._griffin_lim(magnitudes)
+            audio = audio.clamp(-1, 1) * MAX_WAV_VALUE
+            return audio[0].numpy().astype("int16")
+
+    def _stft(self, audio):
+        return torch.stft(
+            audio,
+            self.filter_length,
+            self.hop_length,
+            self.win_length,
+            self.window,
+            pad_mode="reflect",
+            return_complex=True,
+        )
+
+    def _istft(self, spectrogram, length):
+        return torch.istft(
+            spectrogram, self.filter_length, self.hop_length, self.win_length, self.window, length=length
+        )
+
+    def _griffin_lim(self, magnitudes):
+        # Like TacotronSTFT, n frames cover (n - 1) * hop_length samples
+        num_frames = magnitudes.size(2)
+        length = (num_frames - 1) * self.hop_length
+
+        # Fixed seed so the same mel always gives the same audio
+        generator = torch.Generator().manual_seed(0)
+        phases = 2 * math.pi * torch.rand(magnitudes.shape, generator=generator)
+        angles = torch.polar(torch.ones_like(magnitudes), phases)
+        previous = torch.zeros_like(angles)
+        for _ in range(self.n_iters):
+            rebuilt = self._stft(self._istft(magnitudes * angles, length))
+            # Extrapolate along the direction the estimate is moving in
+            angles = rebuilt - previous * (self.momentum / (1 + self.momentum))
+            angles = angles / (angles.abs() + 1e-16)
+            previous = rebuilt
+        # Pad to hop_length samples per frame, like the other vocoders
+        return self._istft(magnitudes * angles, num_frames * self.hop_length)
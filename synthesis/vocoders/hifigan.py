@@ -1,8 +1,11 @@
 import json
+import math
+
+import numpy as np
 import torch
 
 from synthesis.vocoders.hifigan_model import Generator
-from synthesis.vocoders.vocoder import Vocoder, MAX_WAV_VALUE
+from synthesis.vocoders.vocoder import Vocoder, MAX_WAV_VALUE, pad_mels
 
 
 class AttrDict(dict):
@@ -15,14 +18,58 @@ class AttrDict(dict):
         self.__dict__ = self
 
 
+def get_receptive_field(h):
+    """
+    Calculates how many mel frames either side of a frame affect its generated audio.
+
+    Parameters
+    ----------
+    h : AttrDict
+        Hifigan config
+
+    Returns
+    -------
+    int
+        Receptive field radius in mel frames (rounded up)
+    """
+    # conv_pre has kernel size 7
+    frames = 3.0
+    rate = 1
+    for u, k in zip(h.upsample_rates, h.upsample_kernel_sizes):
+        # Each transposed conv output depends on about k / u inputs at the previous rate
+        frames += math.ceil(k / u / 2) / rate
+        rate *= u
+        # The widest resblock at this rate
+        widest = 0
+        for kernel, dilations in zip(h.resblock_kernel_sizes, h.resblock_dilation_sizes):
+            if h.resblock == "1":
+                widest = max(widest, sum((kernel - 1) * d // 2 + (kernel - 1) // 2 for d in dilations))
+            else:
+                widest = max(widest, sum((kernel - 1) * d // 2 for d in dilations))
+        frames += widest / rate
+    # conv_post has kernel size 7
+    frames += 3.0 / rate
+    return math.ceil(frames)
+
+
 class Hifigan(Vocoder):
-    def __init__(self, model_path, config_path):
+    """
+    Hifigan vocoder.
+    On CPU, precision="bf16" runs the generator in bfloat16, which is faster on CPUs with native bf16 support.
+    With tile_frames set, mels (or padded batches) longer than that are vocoded in tiles padded with context_frames
+    either side, so peak memory depends on the tile size rather than the utterance length.
+    """
+
+    def __init__(self, model_path, config_path, precision="fp32", tile_frames=None):
         with open(config_path) as f:
             data = f.read()
 
         # Use GPU if available
         device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
         h = AttrDict(json.loads(data))
+        self.hop_length = math.prod(h.upsample_rates)
+        self.context_frames = get_receptive_field(h)
+        self.tile_frames = tile_frames
         self.model = Generator(h).to(device)
 
         checkpoint_dict = torch.load(model_path, map_location=device)
@@ -30,13 +77,51 @@ class Hifigan(Vocoder):
         self.model.eval()
         self.model.remove_weight_norm()
 
+        self.dtype = torch.bfloat16 if precision == "bf16" and not torch.cuda.is_available() else torch.float32
+        self.model.to(self.dtype)
+
     def generate_audio(self, mel_output):
         with torch.no_grad():
             if torch.cuda.is_available():
                 mel_output = mel_output.type(torch.cuda.FloatTensor)
+            else:
+                mel_output = mel_output.to(self.dtype)
+
+            if self.tile_frames and mel_output.size(2) > self.tile_frames:
+                return self._generate_tiled(mel_output)[0]
 
             y_g_hat = self.model(mel_output)
-            audio = y_g_hat.squeeze()
+            audio = y_g_hat.float().squeeze()
             audio = audio * MAX_WAV_VALUE
             audio = audio.cpu().numpy().astype("int16")
             return audio
+
+    def _generate_tiled(self, mels):
+        num_frames = mels.size(2)
+        audio = np.empty((mels.size(0), num_frames * self.hop_length), dtype=np.int16)
+        for start in range(0, num_frames, self.tile_frames):
+            end = min(start + self.tile_frames, num_frames)
+            # Pad the tile with enough neighbouring frames for its audio to match a single pass
+            mel_start = max(0, start - self.context_frames)
+            mel_end = min(num_frames, end + self.context_frames)
+            y_g_hat = self.model(mels[:, :, mel_start:mel_end])
+            tile = y_g_hat.float()[:, 0, (start - mel_start) * self.hop_length : (end - mel_start) * self.hop_length]
+            audio[:, start * self.hop_length : end * self.hop_length] = (tile * MAX_WAV_VALUE).cpu().numpy()
+        return audio
+
+    def generate_audio_batch(self, mel_outputs):
+        mels, lengths = pad_mels(mel_outputs)
+        with torch.no_grad():
+            if torch.cuda.is_available():
+                mels = mels.type(torch.cuda.FloatTensor)
+            else:
+                mels = mels.to(self.dtype)
+
+            if self.tile_frames and mels.size(2) > self.tile_frames:
+                audio = self._generate_tiled(mels)
+            else:
+                y_g_hat = self.model(mels)
+                audio = y_g_hat.float().squeeze(1)
+                audio = audio * MAX_WAV_VALUE
+                audio = audio.cpu().numpy().astype("int16")
+            return [audio[i, : lengths[i] * self.hop_length] for i in range(len(lengths))]
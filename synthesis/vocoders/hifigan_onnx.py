@@ -0,0 +1,51 @@
+import json
+import math
+import numpy as np
+import torch
+
+from synthesis.vocoders.hifigan import AttrDict, get_receptive_field
+from synthesis.vocoders.vocoder import Vocoder, MAX_WAV_VALUE, pad_mels
+
+
+class HifiganOnnx(Vocoder):
+    """
+    Runs an ONNX export of the Hifigan generator (see synthesis/export.py) with ONNX Runtime on CPU.
+    Requires the onnxruntime package.
+    """
+
+    def __init__(self, model_path, config_path, num_threads=None):
+        import onnxruntime
+
+        with open(config_path) as f:
+            data = f.read()
+
+        h = AttrDict(json.loads(data))
+        self.hop_length = math.prod(h.upsample_rates)
+        self.context_frames = get_receptive_field(h)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def generate_audio(self, mel_output):
+        if isinstance(mel_output, torch.Tensor):
+            mel_output = mel_output.detach().float().cpu().numpy()
+
+        y_g_hat = self.session.run(None, {self.input_name: np.ascontiguousarray(mel_output, dtype=np.float32)})[0]
+        audio = y_g_hat.squeeze()
+        audio = audio * MAX_WAV_VALUE
+        audio = audio.astype("int16")
+        return audio
+
+    def generate_audio_batch(self, mel_outputs):
+        mels, lengths = pad_mels(mel_outputs)
+        mels = mels.detach().float().cpu().numpy()
+
+        y_g_hat = self.session.run(None, {self.input_name: np.ascontiguousarray(mels)})[0]
+        audio = y_g_hat.squeeze(1)
+        audio = audio * MAX_WAV_VALUE
+        audio = audio.astype("int16")
+        return [audio[i, : lengths[i] * self.hop_length] for i in range(len(lengths))]
@@ -1,14 +1,50 @@
+import math
 from abc import ABC, abstractmethod
 
 
 MAX_WAV_VALUE = 32768.0
+# Log of the mel spectrogram clamp floor (silence)
+MEL_PAD_VALUE = math.log(1e-5)
+
+
+def pad_mels(mel_outputs):
+    """
+    Pads mel outputs of different lengths into one batch.
+    Padding is filled with silence.
+
+    Parameters
+    ----------
+    mel_outputs : list
+        Mel spectrogram outputs of shape (1, n_mel_channels, frames)
+
+    Returns
+    -------
+    (Tensor, list)
+        Padded batch of shape (batch, n_mel_channels, max frames) and the length of each mel
+    """
+    lengths = [mel.size(2) for mel in mel_outputs]
+    batch = mel_outputs[0].new_full((len(mel_outputs), mel_outputs[0].size(1), max(lengths)), MEL_PAD_VALUE)
+    for i, mel in enumerate(mel_outputs):
+        batch[i, :, : lengths[i]] = mel[0]
+    return batch, lengths
 
 
 class Vocoder(ABC):
     """
     Produces audio data for tacotron2 mel spectrogram output
+
+    Attributes
+    ----------
+    hop_length : int
+        Number of audio samples generated per mel frame
+    context_frames : int
+        Number of mel frames either side of a frame that affect its audio.
+        Used to pad chunks when vocoding a mel piece by piece
     """
 
+    hop_length = 256
+    context_frames = 0
+
     @abstractmethod
     def generate_audio(self, mel_output):
         """
@@ -25,3 +61,21 @@ class Vocoder(ABC):
             Generated audio data
         """
         pass
+
+    def generate_audio_batch(self, mel_outputs):
+        """
+        Produces wav audio data for several mel outputs.
+        Vocoders that can run a padded batch in one pass override this.
+        Shorter mels are then padded with silence, which can slightly change their last few frames of audio.
+
+        Parameters
+        ----------
+        mel_outputs : list
+            Mel spectrogram outputs of shape (1, n_mel_channels, frames)
+
+        Returns
+        -------
+        list
+            Generated audio data for each mel
+        """
+        return [self.generate_audio(mel) for mel in mel_outputs]
@@ -0,0 +1,192 @@
+import math
+import threading
+
+import discord
+import numpy as np
+from discord.opus import Encoder
+from scipy.signal import firwin
+
+
+class StreamResampler:
+    """
+    Polyphase resampler for audio that arrives in chunks.
+    Keeps the filter history between calls, so the output matches resampling the whole signal at once
+    with scipy.signal.resample_poly, without clicks at chunk boundaries.
+
+    Parameters
+    ----------
+    from_rate : int
+        Input sample rate
+    to_rate : int
+        Output sample rate
+    """
+
+    def __init__(self, from_rate, to_rate):
+        divisor = math.gcd(from_rate, to_rate)
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+
+        # Same anti-aliasing filter as resample_poly
+        half_length = 10 * max(self.up, self.down)
+        h = firwin(2 * half_length + 1, 1.0 / max(self.up, self.down), window=("kaiser", 5.0)) * self.up
+        self.taps = math.ceil(len(h) / self.up)
+        h = np.concatenate([h, np.zeros(self.taps * self.up - len(h))])
+        # phases[p, t] = h[t * up + p]
+        self.phases = np.ascontiguousarray(h.reshape(self.taps, self.up).T)
+        self.delay = half_length
+
+        # The last inputs seen (zeros before the start of the signal)
+        self.history = np.zeros(self.taps)
+        self.consumed = 0
+        self.produced = 0
+
+    def process(self, audio):
+        """
+        Resamples the next chunk of audio.
+        Output lags the input by the filter delay, which flush returns at the end.
+
+        Parameters
+        ----------
+        audio : np.array
+            Next chunk of input audio
+
+        Returns
+        -------
+        np.array
+            float64 resampled audio (same scale as the input)
+        """
+        x = np.concatenate([self.history, audio.astype(np.float64)])
+        # Input index of x[0]
+        start = self.consumed - len(self.history)
+        self.consumed += len(audio)
+
+        # Outputs whose filter window ends within the input seen so far
+        end = max((self.consumed * self.up - 1 - self.delay) // self.down + 1, self.produced)
+        positions = np.arange(self.produced, end) * self.down + self.delay
+        indexes = (positions // self.up - start)[:, None] - np.arange(self.taps)[None, :]
+        y = (x[indexes] * self.phases[positions % self.up]).sum(axis=1)
+
+        self.produced = end
+        self.history = x[-self.taps :]
+        return y
+
+    def flush(self):
+        """
+        Returns the remaining output once all input has been processed.
+
+        Returns
+        -------
+        np.array
+            float64 resampled audio
+        """
+        total = -(-self.consumed * self.up // self.down)
+        produced = self.produced
+        y = self.process(np.zeros(self.taps))
+        return y[: max(total - produced, 0)]
+
+
+class PCMStream(discord.AudioSource):
+    """
+    Discord audio source fed by a synthesis thread while it plays.
+    Mono int16 audio written to it is resampled to 48kHz stereo and queued in a bounded ring buffer.
+    Writes block while the buffer is full, and playback gets silence while it is waiting for synthesis,
+    so the voice connection stays alive between chunks.
+    discord.py reads a 20ms frame at a time and encodes the Opus packets.
+
+    Parameters
+    ----------
+    sample_rate : int
+        Sample rate of the audio written to the stream
+    max_seconds : float (optional)
+        Seconds of audio the ring buffer holds (default is 5)
+    """
+
+    def __init__(self, sample_rate, max_seconds=5.0):
+        self.resampler = StreamResampler(sample_rate, Encoder.SAMPLING_RATE)
+        frames_per_second = 1000 // Encoder.FRAME_LENGTH
+        self.capacity = int(max_seconds * frames_per_second) * Encoder.FRAME_SIZE
+        self.buffer = bytearray(self.capacity)
+        self.start = 0
+        self.size = 0
+        self.condition = threading.Condition()
+        # Synthesis has written everything
+        self.finished = False
+        # Playback has stopped (e.g. the bot left the channel)
+        self.stopped = False
+
+    def write(self, audio):
+        """
+        Queues mono int16 audio, blocking while the buffer is full.
+
+        Parameters
+        ----------
+        audio : np.array
+            int16 audio at the stream's sample rate
+
+        Returns
+        -------
+        bool
+            False once playback has stopped, so synthesis can give up early
+        """
+        return self._push(self._to_pcm(self.resampler.process(audio)))
+
+    def close(self):
+        """
+        Marks the end of the audio. Playback stops once the buffer drains.
+        """
+        self._push(self._to_pcm(self.resampler.flush()))
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+
+    def _to_pcm(self, audio):
+        audio = np.clip(np.round(audio), -32768, 32767).astype("<i2")
+        # Interleave the same samples on both channels
+        return np.repeat(audio, Encoder.CHANNELS).tobytes()
+
+    def _push(self, data):
+        view = memoryview(data)
+        with self.condition:
+            while len(view):
+                while self.size == self.capacity and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return False
+
+                n = min(len(view), self.capacity - self.size)
+                end = (self.start + self.size) % self.capacity
+                first = min(n, self.capacity - end)
+                self.buffer[end : end + first] = view[:first]
+                self.buffer[: n - first] = view[first:n]
+                self.size += n
+                view = view[n:]
+                self.condition.notify_all()
+        return True
+
+    def read(self):
+        with self.condition:
+            if self.size < Encoder.FRAME_SIZE:
+                if not self.finished:
+                    # Synthesis hasn't caught up yet
+                    return bytes(Encoder.FRAME_SIZE)
+                if self.size == 0:
+                    return b""
+
+            # The last frame is padded with silence
+            frame = bytearray(Encoder.FRAME_SIZE)
+            n = min(Encoder.FRAME_SIZE, self.size)
+            first = min(n, self.capacity - self.start)
+            frame[:first] = self.buffer[self.start : self.start + first]
+            frame[first:n] = self.buffer[: n - first]
+            self.start = (self.start + n) % self.capacity
+            self.size -= n
+            self.condition.notify_all()
+            return bytes(frame)
+
+    def is_opus(self):
+        return False
+
+    def cleanup(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
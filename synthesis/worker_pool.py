@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+
+import torch
+
+from training.tacotron2_model import Tacotron2
+from training.tacotron2_model.model import fuse_decoder_weights
+from synthesis.synthesize import synthesize
+from synthesis.vocoders import HifiganOnnx
+
+# Set in the parent before forking so workers inherit the models instead of unpickling copies
+_worker_state = {}
+
+
+def share_weights(module):
+    """
+    Moves a module's parameters and buffers into shared memory,
+    so forked processes map the same pages instead of copying them.
+    Packed (quantized) weights are not tensors and stay copy-on-write.
+
+    Parameters
+    ----------
+    module : torch.nn.Module
+        Module to share
+    """
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        if tensor.device.type == "cpu":
+            tensor.share_memory_()
+
+
+def _init_worker(num_threads):
+    torch.set_num_threads(num_threads)
+
+
+def _synthesize(kwargs):
+    with torch.inference_mode():
+        return synthesize(
+            model=_worker_state["model"], vocoder=_worker_state["vocoder"], **_worker_state["defaults"], **kwargs
+        )
+
+
+class WorkerPool:
+    """
+    Pre-fork pool of synthesis processes sharing one copy of the model weights.
+    The parent loads the models once and moves their weights into shared memory before forking,
+    so resident memory grows by each worker's activations rather than a full copy of the models.
+    Each worker gets its own torch thread budget so workers don't compete for cores.
+    Needs the fork start method (Linux/macOS) and a PyTorch vocoder (ONNX Runtime sessions can't be forked).
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Tacotron2 model
+    vocoder : Object
+        Vocoder model
+    num_workers : int (optional)
+        Number of worker processes (default is 2)
+    num_threads : int (optional)
+        Torch threads per worker (default is the CPU count split between workers)
+    **defaults
+        Extra synthesize arguments for every job (e.g. cache, mel_cache).
+        Each worker gets its own copy, so in-memory cache tiers are per worker while the on-disk tiers are shared
+    """
+
+    def __init__(self, model, vocoder, num_workers=2, num_threads=None, **defaults):
+        assert not isinstance(vocoder, HifiganOnnx), "ONNX Runtime vocoders can't be shared with forked workers"
+
+        # Fuse the decoder weights once here, so workers share them instead of fusing them on every request
+        if isinstance(model, Tacotron2):
+            if model.decoder.fused_weights is None:
+                model.decoder.fused_weights = fuse_decoder_weights(model.decoder)
+            for tensor in model.decoder.fused_weights:
+                tensor.share_memory_()
+
+        share_weights(model)
+        # Griffin-Lim has no model
+        if hasattr(vocoder, "model"):
+            share_weights(vocoder.model)
+
+        _worker_state["model"] = model
+        _worker_state["vocoder"] = vocoder
+        _worker_state["defaults"] = defaults
+
+        num_threads = num_threads or max(1, os.cpu_count() // num_workers)
+        context = multiprocessing.get_context("fork")
+        self.pool = context.Pool(num_workers, initializer=_init_worker, initargs=(num_threads,))
+
+    def synthesize(self, **kwargs):
+        """
+        Runs synthesize in a worker process and waits for it.
+        Takes the same arguments as synthesize, apart from model and vocoder.
+        """
+        return self.pool.apply(_synthesize, (kwargs,))
+
+    def close(self):
+        """
+        Stops the worker processes once their current jobs finish.
+        """
+        self.pool.close()
+        self.pool.join()
@@ -0,0 +1,47 @@
+import copy
+
+import torch
+from torch import nn
+
+from training.tacotron2_model import Tacotron2
+from training.tacotron2_model.model import fold_batch_norm
+
+
+def make_model():
+    torch.manual_seed(0)
+    model = Tacotron2()
+    # Freshly initialised BatchNorms are identities, so give them stats and affine params to fold
+    for module in model.modules():
+        if isinstance(module, nn.BatchNorm1d):
+            module.running_mean.uniform_(-0.5, 0.5)
+            module.running_var.uniform_(0.5, 2.0)
+            module.weight.data.uniform_(0.5, 1.5)
+            module.bias.data.uniform_(-0.5, 0.5)
+    return model.eval()
+
+
+def test_fold_batch_norm_matches_encoder():
+    model = make_model()
+    folded = fold_batch_norm(copy.deepcopy(model))
+    embedded = torch.randn(2, 512, 40)
+
+    with torch.inference_mode():
+        torch.testing.assert_close(
+            folded.encoder.inference(embedded), model.encoder.inference(embedded), rtol=1e-5, atol=1e-5
+        )
+
+
+def test_fold_batch_norm_matches_postnet():
+    model = make_model()
+    folded = fold_batch_norm(copy.deepcopy(model))
+    mel = torch.randn(2, 80, 100)
+
+    with torch.inference_mode():
+        torch.testing.assert_close(folded.postnet(mel), model.postnet(mel), rtol=1e-5, atol=1e-5)
+
+
+def test_fold_batch_norm_removes_batch_norm():
+    folded = fold_batch_norm(make_model())
+
+    for convolutions in (folded.encoder.convolutions, folded.postnet.convolutions):
+        assert not any(isinstance(module, nn.BatchNorm1d) for module in convolutions.modules())
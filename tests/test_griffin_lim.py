@@ -0,0 +1,15 @@
+import numpy as np
+import torch
+
+from synthesis.vocoders.griffin_lim import GriffinLimVocoder
+
+
+def test_griffin_lim_batch_matches_single():
+    vocoder = GriffinLimVocoder(n_iters=4)
+    torch.manual_seed(0)
+    mel = torch.randn(1, 80, 60) - 4
+    other = torch.randn(1, 80, 150) - 4
+
+    audio = vocoder.generate_audio(mel)
+    np.testing.assert_array_equal(vocoder.generate_audio_batch([other, mel])[1], audio)
+    assert len(audio) == 60 * vocoder.hop_length
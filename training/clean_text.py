@@ -1,5 +1,11 @@
 import argparse
+import itertools
+import multiprocessing
+import os
 import re
+import time
+from collections import deque
+from functools import lru_cache
 
 import inflect
 from training import DEFAULT_ALPHABET
@@ -34,6 +40,85 @@ ABBREVIATION_REPLACEMENT = {
     "col.": "colonel",
     "ft.": "fort",
 }
+# Everything clean_text rewrites, matched in a single pass.
+# Alternatives are tried in the order the replacements used to be applied
+NORMALIZE_RE = re.compile(
+    "|".join(
+        [
+            r"(?P<currency>%s)" % CURRENCY.pattern,
+            r"(?P<ordinal>%s)" % ORDINALS.pattern,
+            r"(?P<comma_number>%s)" % COMMA_NUMBER_RE.pattern,
+            r"(?P<decimal_number>%s)" % DECIMAL_NUMBER_RE.pattern,
+            r"(?P<number>%s)" % NUMBER_RE.pattern,
+            # Abbreviations are only replaced between spaces
+            r"(?<= )(?P<abbreviation>%s)(?= )" % "|".join(re.escape(key) for key in ABBREVIATION_REPLACEMENT),
+            r"(?P<whitespace>%s)" % WHITESPACE_RE.pattern,
+        ]
+    )
+)
+# Numbers inside a currency amount
+AMOUNT_RE = re.compile(
+    "|".join(pattern.pattern for pattern in [ORDINALS, COMMA_NUMBER_RE, DECIMAL_NUMBER_RE, NUMBER_RE])
+)
+
+
+@lru_cache(maxsize=4096)
+def number_to_words(number):
+    """
+    Memoized inflect number_to_words.
+
+    Parameters
+    ----------
+    number : str
+        Number to convert (may include commas, decimals or an ordinal suffix)
+
+    Returns
+    -------
+    str
+        Number in words
+    """
+    return INFLECT_ENGINE.number_to_words(number)
+
+
+def _replace_number(match):
+    return number_to_words(match.group())
+
+
+def _replace(match):
+    kind = match.lastgroup
+    value = match.group()
+    if kind == "whitespace":
+        return " "
+    elif kind == "abbreviation":
+        return ABBREVIATION_REPLACEMENT[value]
+    elif kind == "currency":
+        amount = AMOUNT_RE.sub(_replace_number, value[1:])
+        for key, name in MONETARY_REPLACEMENT.items():
+            if key in value:
+                return amount + name
+        return value[0] + amount
+    return number_to_words(value)
+
+
+class _SymbolTable(dict):
+    """
+    str.translate table keeping only the given symbols.
+    Characters are looked up on first use, so any unicode text can be filtered.
+    """
+
+    def __init__(self, symbols):
+        super(_SymbolTable, self).__init__()
+        self.symbols = set(symbols)
+
+    def __missing__(self, key):
+        value = key if chr(key) in self.symbols else None
+        self[key] = value
+        return value
+
+
+@lru_cache(maxsize=16)
+def _symbol_table(symbols):
+    return _SymbolTable(symbols)
 
 
 def clean_text(text, symbols=DEFAULT_ALPHABET, remove_invalid_characters=True):
@@ -61,53 +146,97 @@ def clean_text(text, symbols=DEFAULT_ALPHABET, remove_invalid_characters=True):
     """
     text = text.strip()
     text = text.lower()
-    # Convert currency to words
-    money = re.findall(CURRENCY, text)
-    for amount in money:
-        for key, value in MONETARY_REPLACEMENT.items():
-            if key in amount:
-                text = text.replace(amount, amount[1:] + value)
-    # Convert ordinals to words
-    ordinals = re.findall(ORDINALS, text)
-    for ordinal in ordinals:
-        text = text.replace(ordinal, INFLECT_ENGINE.number_to_words(ordinal))
-    # Convert comma & decimal numbers to words
-    numbers = re.findall(COMMA_NUMBER_RE, text) + re.findall(DECIMAL_NUMBER_RE, text)
-    for number in numbers:
-        text = text.replace(number, INFLECT_ENGINE.number_to_words(number))
-    # Convert standard numbers to words
-    numbers = re.findall(NUMBER_RE, text)
-    for number in numbers:
-        text = text.replace(number, INFLECT_ENGINE.number_to_words(number))
-    # Replace abbreviations
-    for key, value in ABBREVIATION_REPLACEMENT.items():
-        text = text.replace(" " + key + " ", " " + value + " ")
-    # Collapse whitespace
-    text = re.sub(WHITESPACE_RE, " ", text)
+    # Convert currency, ordinals & numbers to words, replace abbreviations and collapse whitespace
+    text = NORMALIZE_RE.sub(_replace, text)
     # Remove banned characters
     if remove_invalid_characters:
-        text = "".join([c for c in text if c in symbols])
+        text = text.translate(_symbol_table(tuple(symbols)))
     return text
 
 
+def _clean_rows(rows):
+    cleaned = []
+    for row in rows:
+        filename, text = row.split("|")
+        cleaned.append(f"{filename}|{clean_text(text)}\n")
+    return cleaned
+
+
+def _ordered_results(pool, chunks, max_pending):
+    # Keeps up to max_pending chunks in flight, yielding results in input order
+    pending = deque()
+    for chunk in chunks:
+        pending.append(pool.apply_async(_clean_rows, (chunk,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def clean_file(input_path, output_path, workers=None, chunk_size=1000, report_interval=10):
+    """
+    Cleans a "filename|text" transcript, streaming it line by line.
+    Chunks of rows are cleaned across a process pool and written back in order.
+    At most a few chunks per worker are held at once, so memory stays constant however long the file is.
+
+    Parameters
+    ----------
+    input_path : str
+        Path to transcript
+    output_path : str
+        Path to save cleaned transcript to
+    workers : int (optional)
+        Number of processes (default is the CPU count, 1 cleans in this process)
+    chunk_size : int (optional)
+        Rows sent to a process at a time (default is 1000)
+    report_interval : float (optional)
+        Seconds between progress reports (default is 10)
+
+    Returns
+    -------
+    int
+        Number of rows cleaned
+    """
+    workers = workers or os.cpu_count()
+    start_time = time.time()
+    last_report = start_time
+    total = 0
+
+    with open(input_path) as f, open(output_path, "w") as out:
+        # Skip blank lines (e.g. a trailing newline)
+        rows = (row for row in f if row.strip())
+        chunks = iter(lambda: list(itertools.islice(rows, chunk_size)), [])
+
+        if workers == 1:
+            results = map(_clean_rows, chunks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(workers)
+            results = _ordered_results(pool, chunks, 2 * workers)
+
+        try:
+            for cleaned in results:
+                out.writelines(cleaned)
+                total += len(cleaned)
+                if time.time() - last_report >= report_interval:
+                    last_report = time.time()
+                    print(f"Cleaned {total} rows ({total / (last_report - start_time):.0f} rows/s)")
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    duration = time.time() - start_time
+    print(f"Cleaned {total} rows in {duration:.1f}s ({total / max(duration, 1e-9):.0f} rows/s)")
+    return total
+
+
 if __name__ == "__main__":
     """Script to clean text for training"""
     parser = argparse.ArgumentParser(description="Clean & improve text for training")
     parser.add_argument("-f", "--file", help="Text file path", type=str, required=True)
     parser.add_argument("-o", "--output", help="Output text file path", type=str, required=True)
+    parser.add_argument("-w", "--workers", help="Number of processes (default is the CPU count)", type=int)
+    parser.add_argument("-c", "--chunk_size", help="Rows per process task", type=int, default=1000)
     args = parser.parse_args()
 
-    with open(args.file) as f:
-        rows = f.readlines()
-
-    cleaned_text = []
-
-    for row in rows:
-        filename, text = row.split("|")
-        text = clean_text(text)
-        cleaned_text.append(f"{filename}|{text}")
-
-    with open(args.output, "w") as f:
-        for line in cleaned_text:
-            f.write(line)
-            f.write("\n")
+    clean_file(args.file, args.output, args.workers, args.chunk_size)
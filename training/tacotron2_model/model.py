@@ -34,6 +34,7 @@ import torch
 from torch.autograd import Variable
 from torch import nn
 from torch.nn import functional as F
+from torch.nn.utils.fusion import fuse_conv_bn_eval
 from training.tacotron2_model.layers import ConvNorm, LinearNorm
 from training.tacotron2_model.utils import to_gpu, get_mask_from_lengths, get_x
 
@@ -181,10 +182,21 @@ class Postnet(nn.Module):
             )
         )
 
-    def forward(self, x):
+    def forward(self, x, mask=None):
+        """
+        PARAMS
+        ------
+        x: decoder mel outputs (B, n_mel_channels, T_out)
+        mask: optional padding mask (B, 1, T_out). Padded frames are zeroed
+        after every convolution so batched items match unbatched inference
+        """
         for i in range(len(self.convolutions) - 1):
             x = F.dropout(torch.tanh(self.convolutions[i](x)), 0.5, self.training)
+            if mask is not None:
+                x = x.masked_fill(mask, 0.0)
         x = F.dropout(self.convolutions[-1](x), 0.5, self.training)
+        if mask is not None:
+            x = x.masked_fill(mask, 0.0)
 
         return x
 
@@ -236,18 +248,245 @@ class Encoder(nn.Module):
 
         return outputs
 
-    def inference(self, x):
+    def inference(self, x, input_lengths=None):
+        """Encoder inference
+        PARAMS
+        ------
+        x: embedded inputs (B, embedding_dim, T_in)
+        input_lengths: optional unpadded lengths for batched inputs (B)
+
+        RETURNS
+        -------
+        outputs: encoder outputs (B, T_in, encoder_embedding_dim)
+        """
+        if input_lengths is None:
+            for conv in self.convolutions:
+                x = F.dropout(F.relu(conv(x)), 0.5, self.training)
+
+            x = x.transpose(1, 2)
+
+            # Dynamically quantized LSTMs have no flat weights
+            if hasattr(self.lstm, "flatten_parameters"):
+                self.lstm.flatten_parameters()
+            outputs, _ = self.lstm(x)
+
+            return outputs
+
+        # Zero the padding after every convolution so it never leaks into real frames
+        total_length = x.size(2)
+        mask = ~get_mask_from_lengths(input_lengths, x.device, total_length).unsqueeze(1)
+        x = x.masked_fill(mask, 0.0)
         for conv in self.convolutions:
             x = F.dropout(F.relu(conv(x)), 0.5, self.training)
+            x = x.masked_fill(mask, 0.0)
 
         x = x.transpose(1, 2)
+        x = nn.utils.rnn.pack_padded_sequence(x, input_lengths.cpu(), batch_first=True, enforce_sorted=False)
 
-        self.lstm.flatten_parameters()
+        # Dynamically quantized LSTMs have no flat weights
+        if hasattr(self.lstm, "flatten_parameters"):
+            self.lstm.flatten_parameters()
         outputs, _ = self.lstm(x)
 
+        outputs, _ = nn.utils.rnn.pad_packed_sequence(outputs, batch_first=True, total_length=total_length)
+
         return outputs
 
 
+class StepBuffer:
+    """Preallocated (B, T, C) tensor that decoder steps are written into.
+    Doubles its capacity (up to max_capacity) when full instead of
+    collecting thousands of small tensors to stack at the end.
+    """
+
+    def __init__(self, template, channels, capacity, max_capacity):
+        self.data = template.new_empty(template.size(0), capacity, channels)
+        self.max_capacity = max_capacity
+        self.length = 0
+
+    def append(self, step):
+        if self.length == self.data.size(1):
+            capacity = min(2 * self.data.size(1), self.max_capacity)
+            grown = self.data.new_empty(self.data.size(0), capacity, self.data.size(2))
+            grown[:, : self.length] = self.data
+            self.data = grown
+        self.data[:, self.length] = step
+        self.length += 1
+
+    def get(self):
+        return self.data[:, : self.length]
+
+
+def fold_batch_norm(model):
+    """Folds the BatchNorm after each encoder and postnet convolution into
+    the convolution's weight and bias, since in eval mode it is a fixed
+    per-channel scale and shift. Each BatchNorm1d is replaced by an identity.
+    The result is inference only: it can't be trained or saved as a checkpoint
+    PARAMS
+    ------
+    model: Tacotron2 in eval mode
+
+    RETURNS
+    -------
+    model: the same model, folded in place
+    """
+    assert not model.training, "BatchNorm can only be folded in eval mode"
+    for convolutions in (model.encoder.convolutions, model.postnet.convolutions):
+        for conv in convolutions:
+            if isinstance(conv[1], nn.BatchNorm1d):
+                conv[0].conv = fuse_conv_bn_eval(conv[0].conv, conv[1])
+                conv[1] = nn.Identity()
+    return model
+
+
+def get_linear_weight(layer):
+    """Float weight of a LinearNorm, including dynamically quantized ones"""
+    weight = layer.linear_layer.weight
+    return weight().dequantize() if callable(weight) else weight
+
+
+def get_linear_bias(layer):
+    """Float bias of a LinearNorm, including dynamically quantized ones"""
+    bias = layer.linear_layer.bias
+    return bias() if callable(bias) else bias
+
+
+def fuse_decoder_weights(decoder):
+    """Precomputes the weights used by the fused inference decoder step
+    PARAMS
+    ------
+    decoder: Decoder
+
+    RETURNS
+    -------
+    query_weight: attention query projection (attention_dim, attention_rnn_dim)
+    v_weight: attention energy projection (1, attention_dim)
+    location_weight: location conv folded with the location dense layer (attention_dim, 2, kernel_size)
+    projection_weight: mel and gate projections stacked (n_mel_channels * n_frames_per_step + 1, in_dim)
+    projection_bias: mel and gate biases stacked
+    """
+    attention = decoder.attention_layer
+    location = attention.location_layer
+    with torch.no_grad():
+        # location_dense(location_conv(x)) is linear in x, so fold both into one conv
+        location_weight = torch.einsum(
+            "af,fck->ack", get_linear_weight(location.location_dense), location.location_conv.conv.weight
+        ).contiguous()
+        # Project the mel frame and gate energy with a single matmul
+        projection_weight = torch.cat(
+            (get_linear_weight(decoder.linear_projection), get_linear_weight(decoder.gate_layer)), dim=0
+        )
+        projection_bias = torch.cat(
+            (get_linear_bias(decoder.linear_projection), get_linear_bias(decoder.gate_layer)), dim=0
+        )
+    return (
+        get_linear_weight(attention.query_layer),
+        get_linear_weight(attention.v),
+        location_weight,
+        projection_weight,
+        projection_bias,
+    )
+
+
+class FusedDecoderStep:
+    """Inference-only decoder step.
+    Concatenated inputs live in preallocated buffers that each step writes
+    into, the location conv and dense layer are folded into a single conv,
+    the mel and gate projections share one matmul and the attention energies
+    are computed in (B, attention_dim, T_in) layout so no transposes are needed.
+    All state is held here rather than on the decoder. Steps never record
+    an autograd graph, since the buffers are updated in place.
+    """
+
+    @torch.no_grad()
+    def __init__(self, decoder, memory, mask=None):
+        B = memory.size(0)
+        MAX_TIME = memory.size(1)
+        attention = decoder.attention_layer
+
+        self.decoder = decoder
+        self.memory = memory
+        self.mask = mask
+        self.prenet_dim = decoder.prenet_dim
+        self.attention_rnn_dim = decoder.attention_rnn_dim
+        self.decoder_rnn_dim = decoder.decoder_rnn_dim
+        self.score_mask_value = attention.score_mask_value
+
+        # (B, T_in, attention_dim) -> (B, attention_dim, T_in)
+        self.processed_memory = attention.memory_layer(memory).transpose(1, 2).contiguous()
+        self.location_padding = attention.location_layer.location_conv.conv.padding
+        (
+            self.query_weight,
+            self.v_weight,
+            self.location_weight,
+            self.projection_weight,
+            self.projection_bias,
+        ) = decoder.fused_weights or fuse_decoder_weights(decoder)
+
+        self.attention_hidden = memory.new_zeros(B, decoder.attention_rnn_dim)
+        self.attention_cell = memory.new_zeros(B, decoder.attention_rnn_dim)
+        self.decoder_hidden = memory.new_zeros(B, decoder.decoder_rnn_dim)
+        self.decoder_cell = memory.new_zeros(B, decoder.decoder_rnn_dim)
+
+        # [prenet output, attention context]
+        self.cell_input = memory.new_zeros(B, decoder.prenet_dim + decoder.encoder_embedding_dim)
+        # [attention weights, cumulative attention weights]
+        self.attention_weights_cat = memory.new_zeros(B, 2, MAX_TIME)
+        self.attention_weights = self.attention_weights_cat[:, 0]
+        self.attention_weights_cum = self.attention_weights_cat[:, 1]
+        # [attention hidden, attention context]
+        self.attention_hidden_context = memory.new_zeros(B, decoder.attention_rnn_dim + decoder.encoder_embedding_dim)
+        # [decoder hidden, attention context]
+        self.decoder_hidden_context = memory.new_zeros(B, decoder.decoder_rnn_dim + decoder.encoder_embedding_dim)
+
+    @torch.no_grad()
+    def __call__(self, decoder_input):
+        """Decoder step
+        PARAMS
+        ------
+        decoder_input: prenet output for the previous mel frame
+
+        RETURNS
+        -------
+        mel_output:
+        gate_output: gate output energies
+        attention_weights: view of the current attention weights, overwritten by the next step
+        """
+        decoder = self.decoder
+
+        self.cell_input[:, : self.prenet_dim] = decoder_input
+        self.attention_hidden, self.attention_cell = decoder.attention_rnn(
+            self.cell_input, (self.attention_hidden, self.attention_cell)
+        )
+        self.attention_hidden = F.dropout(self.attention_hidden, decoder.p_attention_dropout, decoder.training)
+
+        processed_query = F.linear(self.attention_hidden, self.query_weight)
+        energies = F.conv1d(self.attention_weights_cat, self.location_weight, padding=self.location_padding)
+        energies += processed_query.unsqueeze(2)
+        energies += self.processed_memory
+        energies = torch.matmul(self.v_weight, torch.tanh(energies)).squeeze(1)
+        if self.mask is not None:
+            energies.masked_fill_(self.mask, self.score_mask_value)
+
+        self.attention_weights.copy_(F.softmax(energies, dim=1))
+        self.attention_weights_cum += self.attention_weights
+        attention_context = torch.bmm(self.attention_weights.unsqueeze(1), self.memory).squeeze(1)
+
+        self.attention_hidden_context[:, : self.attention_rnn_dim] = self.attention_hidden
+        self.attention_hidden_context[:, self.attention_rnn_dim :] = attention_context
+        self.decoder_hidden, self.decoder_cell = decoder.decoder_rnn(
+            self.attention_hidden_context, (self.decoder_hidden, self.decoder_cell)
+        )
+        self.decoder_hidden = F.dropout(self.decoder_hidden, decoder.p_decoder_dropout, decoder.training)
+
+        self.decoder_hidden_context[:, : self.decoder_rnn_dim] = self.decoder_hidden
+        self.decoder_hidden_context[:, self.decoder_rnn_dim :] = attention_context
+        self.cell_input[:, self.prenet_dim :] = attention_context
+
+        projection = F.linear(self.decoder_hidden_context, self.projection_weight, self.projection_bias)
+        return projection[:, :-1], projection[:, -1:], self.attention_weights
+
+
 class Decoder(nn.Module):
     def __init__(
         self,
@@ -295,6 +534,9 @@ class Decoder(nn.Module):
 
         self.gate_layer = LinearNorm(decoder_rnn_dim + encoder_embedding_dim, 1, bias=True, w_init_gain="sigmoid")
 
+        # Output of fuse_decoder_weights, reused by every inference call once set (None recomputes it each call)
+        self.fused_weights = None
+
     def get_go_frame(self, memory):
         """Gets all zeros frames to use as first decoder input
         PARAMS
@@ -316,7 +558,7 @@ class Decoder(nn.Module):
         PARAMS
         ------
         memory: Encoder outputs
-        mask: Mask for padded data if training, expects None for inference
+        mask: Mask for padded data, None for unbatched inference
         """
         B = memory.size(0)
         MAX_TIME = memory.size(1)
@@ -457,17 +699,21 @@ class Decoder(nn.Module):
 
         return mel_outputs, gate_outputs, alignments
 
-    def inference(self, memory, max_decoder_steps=None):
+    def inference(self, memory, max_decoder_steps=None, memory_lengths=None, return_alignments=True):
         """Decoder inference
         PARAMS
         ------
         memory: Encoder outputs
+        max_decoder_steps: Maximum number of decoder steps (optional)
+        memory_lengths: Encoder output lengths for attention masking of batched inputs (optional)
+        return_alignments: Whether to record the attention weights of every step
 
         RETURNS
         -------
         mel_outputs: mel outputs from the decoder
         gate_outputs: gate outputs from the decoder
-        alignments: sequence of attention weights from the decoder
+        alignments: sequence of attention weights from the decoder (None if not recorded)
+        mel_lengths: number of frames decoded for each item before its gate fired
         """
         if not max_decoder_steps:
             # Use default max decoder steps if not given
@@ -475,29 +721,94 @@ class Decoder(nn.Module):
 
         decoder_input = self.get_go_frame(memory)
 
-        self.initialize_decoder_states(memory, mask=None)
+        mask = None
+        if memory_lengths is not None:
+            mask = ~get_mask_from_lengths(memory_lengths, memory.device, memory.size(1))
+        decode = FusedDecoderStep(self, memory, mask)
+
+        # Every item keeps decoding until the whole batch has stopped,
+        # so track where each one's gate first fired
+        mel_lengths = torch.zeros(memory.size(0), dtype=torch.long, device=memory.device)
+        not_finished = torch.ones(memory.size(0), dtype=torch.bool, device=memory.device)
+
+        # Most sentences need fewer than 8 frames per input symbol, so the buffers rarely grow
+        capacity = min(max_decoder_steps, max(64, 8 * memory.size(1)))
+        mel_outputs = StepBuffer(memory, self.n_mel_channels * self.n_frames_per_step, capacity, max_decoder_steps)
+        gate_outputs = StepBuffer(memory, 1, capacity, max_decoder_steps)
+        alignments = StepBuffer(memory, memory.size(1), capacity, max_decoder_steps) if return_alignments else None
 
-        mel_outputs, gate_outputs, alignments = [], [], []
         while True:
             decoder_input = self.prenet(decoder_input)
-            mel_output, gate_output, alignment = self.decode(decoder_input)
+            mel_output, gate_output, alignment = decode(decoder_input)
 
-            mel_outputs += [mel_output.squeeze(1)]
-            gate_outputs += [gate_output]
-            alignments += [alignment]
+            mel_outputs.append(mel_output)
+            gate_outputs.append(gate_output)
+            if alignments is not None:
+                alignments.append(alignment)
 
-            if torch.sigmoid(gate_output.data) > self.gate_threshold:
+            mel_lengths += not_finished.long()
+            not_finished &= torch.sigmoid(gate_output.data.squeeze(1)) <= self.gate_threshold
+
+            if not not_finished.any():
                 break
-            elif len(mel_outputs) == max_decoder_steps:
+            elif mel_outputs.length == max_decoder_steps:
                 raise Exception(
                     "Warning! Reached max decoder steps. Either the model is low quality or the given sentence is too short/long"
                 )
 
             decoder_input = mel_output
 
-        mel_outputs, gate_outputs, alignments = self.parse_decoder_outputs(mel_outputs, gate_outputs, alignments)
+        # (B, T_out, n_mel_channels * n_frames_per_step) -> (B, n_mel_channels, T_out)
+        mel_outputs = mel_outputs.get()
+        mel_outputs = mel_outputs.reshape(mel_outputs.size(0), -1, self.n_mel_channels).transpose(1, 2)
+        gate_outputs = gate_outputs.get()
+        alignments = alignments.get() if alignments is not None else None
 
-        return mel_outputs, gate_outputs, alignments
+        return mel_outputs, gate_outputs, alignments, mel_lengths
+
+    def inference_stream(self, memory, max_decoder_steps=None, chunk_size=32):
+        """Decoder inference that yields mel frames while still decoding
+        PARAMS
+        ------
+        memory: Encoder outputs
+        max_decoder_steps: Maximum number of decoder steps (optional)
+        chunk_size: Number of frames to collect before yielding them
+
+        YIELDS
+        -------
+        mel_outputs: (B, n_mel_channels, <= chunk_size) frames decoded since the previous chunk
+        """
+        if not max_decoder_steps:
+            # Use default max decoder steps if not given
+            max_decoder_steps = self.max_decoder_steps
+
+        decoder_input = self.get_go_frame(memory)
+
+        decode = FusedDecoderStep(self, memory)
+
+        mel_outputs = []
+        steps = 0
+        while True:
+            decoder_input = self.prenet(decoder_input)
+            mel_output, gate_output, _ = decode(decoder_input)
+
+            mel_outputs += [mel_output.view(mel_output.size(0), self.n_mel_channels, -1)]
+            steps += 1
+
+            if torch.sigmoid(gate_output.data) > self.gate_threshold:
+                break
+            elif steps == max_decoder_steps:
+                raise Exception(
+                    "Warning! Reached max decoder steps. Either the model is low quality or the given sentence is too short/long"
+                )
+
+            if len(mel_outputs) * self.n_frames_per_step >= chunk_size:
+                yield torch.cat(mel_outputs, dim=2)
+                mel_outputs = []
+
+            decoder_input = mel_output
+
+        yield torch.cat(mel_outputs, dim=2)
 
 
 class Tacotron2(nn.Module):
@@ -598,12 +909,48 @@ class Tacotron2(nn.Module):
             device,
         )
 
-    def inference(self, inputs, max_decoder_steps=None):
+    def inference(self, inputs, max_decoder_steps=None, return_alignments=True):
         embedded_inputs = self.embedding(inputs).transpose(1, 2)
         encoder_outputs = self.encoder.inference(embedded_inputs)
-        mel_outputs, gate_outputs, alignments = self.decoder.inference(encoder_outputs, max_decoder_steps)
+        mel_outputs, gate_outputs, alignments, _ = self.decoder.inference(
+            encoder_outputs, max_decoder_steps, return_alignments=return_alignments
+        )
 
         mel_outputs_postnet = self.postnet(mel_outputs)
         mel_outputs_postnet = mel_outputs + mel_outputs_postnet
 
         return [mel_outputs, mel_outputs_postnet, gate_outputs, alignments]
+
+    def inference_stream(self, inputs, max_decoder_steps=None, chunk_size=32):
+        """Inference that yields decoder mel chunks (before the postnet) as they are produced"""
+        embedded_inputs = self.embedding(inputs).transpose(1, 2)
+        encoder_outputs = self.encoder.inference(embedded_inputs)
+        yield from self.decoder.inference_stream(encoder_outputs, max_decoder_steps, chunk_size)
+
+    def inference_batch(self, inputs, input_lengths, max_decoder_steps=None, return_alignments=True):
+        """Batched inference over several zero-padded text sequences
+        PARAMS
+        ------
+        inputs: padded symbol ids (B, T_in)
+        input_lengths: unpadded length of each sequence (B)
+        max_decoder_steps: Maximum number of decoder steps (optional)
+        return_alignments: Whether to record the attention weights (alignments is None otherwise)
+
+        RETURNS
+        -------
+        mel_outputs, mel_outputs_postnet, gate_outputs, alignments: padded to the longest item
+        output_lengths: number of valid mel frames for each item
+        """
+        embedded_inputs = self.embedding(inputs).transpose(1, 2)
+        encoder_outputs = self.encoder.inference(embedded_inputs, input_lengths)
+        mel_outputs, gate_outputs, alignments, output_lengths = self.decoder.inference(
+            encoder_outputs, max_decoder_steps, memory_lengths=input_lengths, return_alignments=return_alignments
+        )
+
+        # Frames decoded after an item's gate fired are discarded before the postnet sees them
+        mask = ~get_mask_from_lengths(output_lengths, inputs.device, mel_outputs.size(2)).unsqueeze(1)
+        mel_outputs = mel_outputs.masked_fill(mask, 0.0)
+        mel_outputs_postnet = self.postnet(mel_outputs, mask)
+        mel_outputs_postnet = mel_outputs + mel_outputs_postnet
+
+        return [mel_outputs, mel_outputs_postnet, gate_outputs, alignments, output_lengths]
@@ -0,0 +1,245 @@
+from typing import List, Optional, Tuple
+
+import torch
+from torch import nn, Tensor
+from torch.nn import functional as F
+from training.tacotron2_model.model import fuse_decoder_weights
+
+
+class ScriptableTacotron2(nn.Module):
+    """Tacotron2 inference that can be compiled with torch.jit.script.
+    Shares the submodules of an eager Tacotron2 but carries all decoder state
+    in local variables instead of attributes, so the whole decode loop runs
+    inside the TorchScript interpreter.
+    Supports inference and inference_batch (streaming needs the eager model).
+    """
+
+    def __init__(self, model):
+        super(ScriptableTacotron2, self).__init__()
+        decoder = model.decoder
+        self.n_mel_channels = model.n_mel_channels
+        self.prenet_dim = decoder.prenet_dim
+        self.attention_rnn_dim = decoder.attention_rnn_dim
+        self.decoder_rnn_dim = decoder.decoder_rnn_dim
+        self.encoder_embedding_dim = decoder.encoder_embedding_dim
+        self.max_decoder_steps = decoder.max_decoder_steps
+        self.gate_threshold = decoder.gate_threshold
+        self.p_attention_dropout = decoder.p_attention_dropout
+        self.p_decoder_dropout = decoder.p_decoder_dropout
+        self.score_mask_value = decoder.attention_layer.score_mask_value
+        self.location_padding = decoder.attention_layer.location_layer.location_conv.conv.padding[0]
+
+        self.embedding = model.embedding
+        self.encoder_convolutions = model.encoder.convolutions
+        self.encoder_lstm = model.encoder.lstm
+        self.prenet_layers = decoder.prenet.layers
+        self.attention_rnn = decoder.attention_rnn
+        self.decoder_rnn = decoder.decoder_rnn
+        self.memory_layer = decoder.attention_layer.memory_layer
+        self.postnet_convolutions = model.postnet.convolutions
+
+        query_weight, v_weight, location_weight, projection_weight, projection_bias = fuse_decoder_weights(decoder)
+        self.register_buffer("query_weight", query_weight.detach().clone())
+        self.register_buffer("v_weight", v_weight.detach().clone())
+        self.register_buffer("location_weight", location_weight)
+        self.register_buffer("projection_weight", projection_weight)
+        self.register_buffer("projection_bias", projection_bias)
+        self.train(model.training)
+
+    def encode(self, inputs: Tensor, input_lengths: Optional[Tensor]) -> Tensor:
+        x = self.embedding(inputs).transpose(1, 2)
+        mask: Optional[Tensor] = None
+        if input_lengths is not None:
+            mask = self.get_padding_mask(input_lengths, x.size(2)).unsqueeze(1)
+            x = x.masked_fill(mask, 0.0)
+        for conv in self.encoder_convolutions:
+            x = F.dropout(F.relu(conv(x)), 0.5, self.training)
+            if mask is not None:
+                x = x.masked_fill(mask, 0.0)
+
+        x = x.transpose(1, 2)
+        if input_lengths is None:
+            outputs, _ = self.encoder_lstm(x)
+            return outputs
+
+        packed = nn.utils.rnn.pack_padded_sequence(x, input_lengths.cpu(), batch_first=True, enforce_sorted=False)
+        packed_outputs, _ = self.encoder_lstm(packed)
+        outputs, _ = nn.utils.rnn.pad_packed_sequence(packed_outputs, batch_first=True, total_length=x.size(1))
+        return outputs
+
+    def postnet(self, x: Tensor, mask: Optional[Tensor]) -> Tensor:
+        last = len(self.postnet_convolutions) - 1
+        for i, conv in enumerate(self.postnet_convolutions):
+            x = conv(x)
+            if i != last:
+                x = torch.tanh(x)
+            x = F.dropout(x, 0.5, self.training)
+            if mask is not None:
+                x = x.masked_fill(mask, 0.0)
+        return x
+
+    def prenet(self, x: Tensor) -> Tensor:
+        for linear in self.prenet_layers:
+            x = F.dropout(F.relu(linear(x)), p=0.5, training=True)
+        return x
+
+    def get_padding_mask(self, lengths: Tensor, max_len: int) -> Tensor:
+        ids = torch.arange(0, max_len, device=lengths.device)
+        return ids.unsqueeze(0) >= lengths.unsqueeze(1)
+
+    def grow(self, buffer: Tensor, max_decoder_steps: int) -> Tensor:
+        capacity = min(2 * buffer.size(1), max_decoder_steps)
+        grown = buffer.new_zeros(buffer.size(0), capacity, buffer.size(2))
+        grown[:, : buffer.size(1)] = buffer
+        return grown
+
+    def decode(
+        self, memory: Tensor, mask: Optional[Tensor], max_decoder_steps: int, return_alignments: bool
+    ) -> Tuple[Tensor, Tensor, Optional[Tensor], Tensor]:
+        """Decoder inference loop with explicit state
+        PARAMS
+        ------
+        memory: Encoder outputs
+        mask: Mask for padded encoder outputs (optional)
+        max_decoder_steps: Maximum number of decoder steps
+        return_alignments: Whether to record the attention weights of every step
+
+        RETURNS
+        -------
+        mel_outputs, gate_outputs, alignments (None if not recorded), mel_lengths
+        """
+        B = memory.size(0)
+        MAX_TIME = memory.size(1)
+
+        processed_memory = self.memory_layer(memory).transpose(1, 2).contiguous()
+        attention_hidden = memory.new_zeros(B, self.attention_rnn_dim)
+        attention_cell = memory.new_zeros(B, self.attention_rnn_dim)
+        decoder_hidden = memory.new_zeros(B, self.decoder_rnn_dim)
+        decoder_cell = memory.new_zeros(B, self.decoder_rnn_dim)
+        cell_input = memory.new_zeros(B, self.prenet_dim + self.encoder_embedding_dim)
+        attention_weights_cat = memory.new_zeros(B, 2, MAX_TIME)
+        attention_hidden_context = memory.new_zeros(B, self.attention_rnn_dim + self.encoder_embedding_dim)
+        decoder_hidden_context = memory.new_zeros(B, self.decoder_rnn_dim + self.encoder_embedding_dim)
+
+        capacity = min(max_decoder_steps, max(64, 8 * MAX_TIME))
+        mel_outputs = memory.new_zeros(B, capacity, self.n_mel_channels)
+        gate_outputs = memory.new_zeros(B, capacity, 1)
+        alignments = memory.new_zeros(B, capacity if return_alignments else 0, MAX_TIME)
+        mel_lengths = torch.zeros(B, dtype=torch.long, device=memory.device)
+        not_finished = torch.ones(B, dtype=torch.bool, device=memory.device)
+
+        decoder_input = memory.new_zeros(B, self.n_mel_channels)
+        step = 0
+        while True:
+            cell_input[:, : self.prenet_dim] = self.prenet(decoder_input)
+            attention_hidden, attention_cell = self.attention_rnn(cell_input, (attention_hidden, attention_cell))
+            attention_hidden = F.dropout(attention_hidden, self.p_attention_dropout, self.training)
+
+            processed_query = F.linear(attention_hidden, self.query_weight)
+            energies = F.conv1d(attention_weights_cat, self.location_weight, padding=self.location_padding)
+            energies = energies + processed_query.unsqueeze(2) + processed_memory
+            energies = torch.matmul(self.v_weight, torch.tanh(energies)).squeeze(1)
+            if mask is not None:
+                energies = energies.masked_fill(mask, self.score_mask_value)
+
+            attention_weights = F.softmax(energies, dim=1)
+            attention_weights_cat[:, 0] = attention_weights
+            attention_weights_cat[:, 1] += attention_weights
+            attention_context = torch.bmm(attention_weights.unsqueeze(1), memory).squeeze(1)
+
+            attention_hidden_context[:, : self.attention_rnn_dim] = attention_hidden
+            attention_hidden_context[:, self.attention_rnn_dim :] = attention_context
+            decoder_hidden, decoder_cell = self.decoder_rnn(attention_hidden_context, (decoder_hidden, decoder_cell))
+            decoder_hidden = F.dropout(decoder_hidden, self.p_decoder_dropout, self.training)
+
+            decoder_hidden_context[:, : self.decoder_rnn_dim] = decoder_hidden
+            decoder_hidden_context[:, self.decoder_rnn_dim :] = attention_context
+            cell_input[:, self.prenet_dim :] = attention_context
+
+            projection = F.linear(decoder_hidden_context, self.projection_weight, self.projection_bias)
+            mel_output = projection[:, :-1]
+            gate_output = projection[:, -1:]
+
+            if step == mel_outputs.size(1):
+                mel_outputs = self.grow(mel_outputs, max_decoder_steps)
+                gate_outputs = self.grow(gate_outputs, max_decoder_steps)
+                if return_alignments:
+                    alignments = self.grow(alignments, max_decoder_steps)
+            mel_outputs[:, step] = mel_output
+            gate_outputs[:, step] = gate_output
+            if return_alignments:
+                alignments[:, step] = attention_weights
+            step += 1
+
+            mel_lengths += not_finished.long()
+            not_finished &= torch.sigmoid(gate_output.squeeze(1)) <= self.gate_threshold
+
+            if not bool(not_finished.any()):
+                break
+            elif step == max_decoder_steps:
+                raise Exception(
+                    "Warning! Reached max decoder steps. Either the model is low quality or the given sentence is too short/long"
+                )
+
+            decoder_input = mel_output
+
+        mel_outputs = mel_outputs[:, :step].transpose(1, 2)
+        gate_outputs = gate_outputs[:, :step]
+        if return_alignments:
+            return mel_outputs, gate_outputs, alignments[:, :step], mel_lengths
+        return mel_outputs, gate_outputs, None, mel_lengths
+
+    @torch.jit.export
+    def inference(
+        self, inputs: Tensor, max_decoder_steps: Optional[int] = None, return_alignments: bool = True
+    ) -> List[Optional[Tensor]]:
+        if max_decoder_steps is None or max_decoder_steps == 0:
+            max_decoder_steps = self.max_decoder_steps
+        encoder_outputs = self.encode(inputs, None)
+        mel_outputs, gate_outputs, alignments, _ = self.decode(encoder_outputs, None, max_decoder_steps, return_alignments)
+
+        mel_outputs_postnet = mel_outputs + self.postnet(mel_outputs, None)
+
+        return [mel_outputs, mel_outputs_postnet, gate_outputs, alignments]
+
+    @torch.jit.export
+    def inference_batch(
+        self,
+        inputs: Tensor,
+        input_lengths: Tensor,
+        max_decoder_steps: Optional[int] = None,
+        return_alignments: bool = True,
+    ) -> List[Optional[Tensor]]:
+        if max_decoder_steps is None or max_decoder_steps == 0:
+            max_decoder_steps = self.max_decoder_steps
+        encoder_outputs = self.encode(inputs, input_lengths)
+        memory_mask = self.get_padding_mask(input_lengths, encoder_outputs.size(1))
+        mel_outputs, gate_outputs, alignments, output_lengths = self.decode(
+            encoder_outputs, memory_mask, max_decoder_steps, return_alignments
+        )
+
+        mask = self.get_padding_mask(output_lengths, mel_outputs.size(2)).unsqueeze(1)
+        mel_outputs = mel_outputs.masked_fill(mask, 0.0)
+        mel_outputs_postnet = mel_outputs + self.postnet(mel_outputs, mask)
+
+        return [mel_outputs, mel_outputs_postnet, gate_outputs, alignments, output_lengths]
+
+    def forward(self, inputs: Tensor) -> List[Optional[Tensor]]:
+        return self.inference(inputs, None, False)
+
+
+def script_model(model):
+    """
+    Compiles a Tacotron2 model's inference path with TorchScript.
+
+    Parameters
+    ----------
+    model : Tacotron2
+        Loaded tacotron2 model
+
+    Returns
+    -------
+    torch.jit.ScriptModule
+        Scripted module exposing inference and inference_batch
+    """
+    return torch.jit.script(ScriptableTacotron2(model))
@@ -29,6 +29,8 @@ ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
 (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
 SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
+from functools import lru_cache
+
 import torch
 import numpy as np
 import torch.nn.functional as F
@@ -42,16 +44,49 @@ from training.tacotron2_model.audio_processing import (
     dynamic_range_decompression,
 )
 
+STFT_BACKENDS = ["fft", "conv"]
+
+
+@lru_cache(maxsize=64)
+def window_envelope(window, n_frames, hop_length, win_length, n_fft):
+    """
+    Cached window sum-square envelope to divide the inverse STFT by.
+    Samples the window doesn't cover are set to 1 so they are left unchanged.
+    The result is shared between calls and must not be modified.
+
+    PARAMS
+    ------
+    window: window specification, as in get_window
+    n_frames: number of STFT frames
+    hop_length: samples between frames
+    win_length: window length
+    n_fft: FFT size
+
+    RETURNS
+    -------
+    envelope: torch.FloatTensor of shape (n_fft + hop_length * (n_frames - 1))
+    """
+    window_sum = window_sumsquare(
+        window, n_frames, hop_length=hop_length, win_length=win_length, n_fft=n_fft, dtype=np.float32
+    )
+    window_sum[window_sum <= tiny(window_sum)] = 1.0
+    return torch.from_numpy(window_sum)
+
 
 class STFT(torch.nn.Module):
-    """adapted from Prem Seetharaman's https://github.com/pseeth/pytorch-stft"""
+    """
+    adapted from Prem Seetharaman's https://github.com/pseeth/pytorch-stft
+    backend="fft" uses real FFTs, "conv" convolves with the dense Fourier basis. Both give the same result
+    """
 
-    def __init__(self, filter_length=800, hop_length=200, win_length=800, window="hann"):
+    def __init__(self, filter_length=800, hop_length=200, win_length=800, window="hann", backend="fft"):
         super(STFT, self).__init__()
+        assert backend in STFT_BACKENDS, "Unknown STFT backend %s" % backend
         self.filter_length = filter_length
         self.hop_length = hop_length
         self.win_length = win_length
         self.window = window
+        self.backend = backend
         self.forward_transform = None
         scale = self.filter_length / self.hop_length
         fourier_basis = np.fft.fft(np.eye(self.filter_length))
@@ -61,6 +96,7 @@ class STFT(torch.nn.Module):
 
         forward_basis = torch.FloatTensor(fourier_basis[:, None, :])
         inverse_basis = torch.FloatTensor(np.linalg.pinv(scale * fourier_basis).T[:, None, :])
+        fft_window = torch.ones(self.filter_length)
 
         if window is not None:
             assert filter_length >= win_length
@@ -75,6 +111,7 @@ class STFT(torch.nn.Module):
 
         self.register_buffer("forward_basis", forward_basis.float())
         self.register_buffer("inverse_basis", inverse_basis.float())
+        self.register_buffer("fft_window", fft_window, persistent=False)
 
     def transform(self, input_data):
         num_batches = input_data.size(0)
@@ -89,13 +126,25 @@ class STFT(torch.nn.Module):
         )
         input_data = input_data.squeeze(1)
 
-        forward_transform = F.conv1d(
-            input_data, Variable(self.forward_basis, requires_grad=False), stride=self.hop_length, padding=0
-        )
+        if self.backend == "fft":
+            forward_transform = torch.stft(
+                input_data.squeeze(1),
+                self.filter_length,
+                self.hop_length,
+                window=self.fft_window,
+                center=False,
+                return_complex=True,
+            )
+            real_part = forward_transform.real
+            imag_part = forward_transform.imag
+        else:
+            forward_transform = F.conv1d(
+                input_data, Variable(self.forward_basis, requires_grad=False), stride=self.hop_length, padding=0
+            )
 
-        cutoff = int((self.filter_length / 2) + 1)
-        real_part = forward_transform[:, :cutoff, :]
-        imag_part = forward_transform[:, cutoff:, :]
+            cutoff = int((self.filter_length / 2) + 1)
+            real_part = forward_transform[:, :cutoff, :]
+            imag_part = forward_transform[:, cutoff:, :]
 
         magnitude = torch.sqrt(real_part**2 + imag_part**2)
         phase = torch.autograd.Variable(torch.atan2(imag_part.data, real_part.data))
@@ -103,29 +152,33 @@ class STFT(torch.nn.Module):
         return magnitude, phase
 
     def inverse(self, magnitude, phase):
-        recombine_magnitude_phase = torch.cat([magnitude * torch.cos(phase), magnitude * torch.sin(phase)], dim=1)
-
-        inverse_transform = F.conv_transpose1d(
-            recombine_magnitude_phase,
-            Variable(self.inverse_basis, requires_grad=False),
-            stride=self.hop_length,
-            padding=0,
-        )
+        if self.backend == "fft":
+            # The pseudo-inverse of the Fourier basis is the inverse real FFT
+            frames = torch.fft.irfft(
+                torch.complex(magnitude * torch.cos(phase), magnitude * torch.sin(phase)), self.filter_length, dim=1
+            )
+            frames = frames * (self.fft_window * (self.hop_length / self.filter_length))[:, None]
+            # Overlap-add the frames
+            output_length = self.filter_length + self.hop_length * (magnitude.size(-1) - 1)
+            inverse_transform = F.fold(
+                frames, (1, output_length), (1, self.filter_length), stride=(1, self.hop_length)
+            ).view(magnitude.size(0), 1, output_length)
+        else:
+            recombine_magnitude_phase = torch.cat([magnitude * torch.cos(phase), magnitude * torch.sin(phase)], dim=1)
+
+            inverse_transform = F.conv_transpose1d(
+                recombine_magnitude_phase,
+                Variable(self.inverse_basis, requires_grad=False),
+                stride=self.hop_length,
+                padding=0,
+            )
 
         if self.window is not None:
-            window_sum = window_sumsquare(
-                self.window,
-                magnitude.size(-1),
-                hop_length=self.hop_length,
-                win_length=self.win_length,
-                n_fft=self.filter_length,
-                dtype=np.float32,
-            )
             # remove modulation effects
-            approx_nonzero_indices = torch.from_numpy(np.where(window_sum > tiny(window_sum))[0])
-            window_sum = torch.autograd.Variable(torch.from_numpy(window_sum), requires_grad=False)
-            window_sum = window_sum.cuda() if magnitude.is_cuda else window_sum
-            inverse_transform[:, :, approx_nonzero_indices] /= window_sum[approx_nonzero_indices]
+            window_sum = window_envelope(
+                self.window, magnitude.size(-1), self.hop_length, self.win_length, self.filter_length
+            )
+            inverse_transform = inverse_transform / window_sum.to(inverse_transform.device)
 
             # scale by hop ratio
             inverse_transform *= float(self.filter_length) / self.hop_length
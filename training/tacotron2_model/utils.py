@@ -37,7 +37,7 @@ import torch
 def get_mask_from_lengths(lengths, device, max_len=None):
     if not max_len:
         max_len = torch.max(lengths).item()
-    ids = torch.arange(0, max_len, out=torch.cuda.LongTensor(max_len)).to(device)
+    ids = torch.arange(0, max_len, device=device)
     mask = (ids < lengths.to(device).unsqueeze(1)).bool()
     return mask
 